@@ -0,0 +1,281 @@
+# Alpha-beta search for the AI.
+#
+# AlphaBeta searches a Position with negamax and principal variation search (PVS): the first move of a node is
+# searched with the full window, the others with a null window, and searched again only when they turn out to
+# be better. The search is iteratively deepened (depth 1, 2, ...) until the depth, time or node budget runs out;
+# the best move of each finished depth is kept, so stopping in the middle of a depth still gives a move.
+#
+# Moves are searched in this order: the best move stored in the transposition table for the position, captures
+# that do not lose material (see see.py) by MVV-LVA (most valuable victim first, then least valuable attacker),
+# the two killer moves of the ply (quiet moves that caused a cutoff in a sibling node), the losing captures,
+# and the other quiet moves by their history score (how often and how deep they caused cutoffs). At depth 0 a
+# quiescence search plays out the captures that do not lose material.
+#
+# Positions found in the tablebases (see tablebase.py) are scored from the table instead of being searched.
+#
+# The evaluation is the material and piece-square score that Position keeps up to date (see evaluation.py),
+# from the point of view of the side to move, so evaluating a leaf costs nothing. MCTSAI.piece_value is only
+# used for move ordering and SEE. Capturing the general wins, so a position where the side to move has lost its
+# general (or has no move) scores -MATE, plus the number of plies from the root so that faster wins are
+# preferred.
+
+import time
+
+from position import NUM_SQUARES, RED, TYPE_MASK
+from see import is_losing_capture, piece_values
+from tablebase import WIN, LOSS
+
+MATE = 100000
+INF = MATE + 1
+# scores beyond this are wins or losses in a number of plies
+MATE_BOUND = MATE - 1000
+MAX_PLY = 64
+
+# transposition table entry flags: the stored score is exact, a lower bound or an upper bound
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# move ordering ranks, above any history score
+TT_MOVE_RANK = 1 << 40
+CAPTURE_RANK = 1 << 36
+KILLER_RANK = 1 << 32
+LOSING_CAPTURE_RANK = 1 << 28
+
+# the clock and the node budget are checked every CLOCK_MASK + 1 nodes, a stop request at every node
+CLOCK_MASK = 127
+
+
+class AlphaBeta:
+    def __init__(self, piece_value, tt_size=1000000, tablebases=None, verbose=False):
+        # piece_value maps the piece names of Piece.name to their value, see MCTSAI
+        # print a summary of every search (it is in the return value of search either way)
+        self.verbose = verbose
+        self.values = piece_values(piece_value)
+        # position key -> (depth, score, flag, best move), cleared when it holds more than tt_size entries
+        self.tt = dict()
+        self.tt_size = tt_size
+        # a TablebaseSet or None
+        self.tablebases = tablebases
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.history = [0] * (NUM_SQUARES * NUM_SQUARES)
+        # budget of the current search
+        self.deadline = None
+        self.max_nodes = None
+        self.stopped = False
+        # set by stop, acted on at the next node once depth 1 has given a move
+        self.stop_requested = False
+        # statistics
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.best_move = None
+
+    def evaluate(self, pos):
+        # from the point of view of the side to move
+        return pos.score if pos.turn == RED else -pos.score
+
+    def capture_rank(self, squares, move):
+        # MVV-LVA
+        frm, to = divmod(move, NUM_SQUARES)
+        return self.values[squares[to] & TYPE_MASK] * 1000 - self.values[squares[frm] & TYPE_MASK]
+
+    def order_moves(self, pos, moves, ply, tt_move):
+        squares = pos.squares
+        killers = self.killers[ply]
+        history = self.history
+        capture_rank = self.capture_rank
+        values = self.values
+
+        def rank(move):
+            if move == tt_move:
+                return TT_MOVE_RANK
+            if squares[move % NUM_SQUARES]:
+                if is_losing_capture(pos, move, values):
+                    return LOSING_CAPTURE_RANK + capture_rank(squares, move)
+                return CAPTURE_RANK + capture_rank(squares, move)
+            if move == killers[0]:
+                return KILLER_RANK + 1
+            if move == killers[1]:
+                return KILLER_RANK
+            return history[move]
+
+        moves.sort(key=rank, reverse=True)
+
+    def check_budget(self):
+        # stops the search when the time or node budget is used up, once depth 1 has given a move
+        if self.best_move is None:
+            return
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            self.stopped = True
+
+    def stop(self):
+        # can be called from another thread to end the search. Like the budget, it takes effect once depth 1 has
+        # given a move, so the search always returns a move when there is one
+        self.stop_requested = True
+
+    def quiesce(self, pos, alpha, beta, ply):
+        # searches only the captures, the side to move can also stand pat with the static evaluation
+        if pos.winning is not None:
+            return -MATE + ply
+        self.nodes += 1
+        if self.stop_requested and self.best_move is not None:
+            self.stopped = True
+        if self.nodes & CLOCK_MASK == 0:
+            self.check_budget()
+        if self.stopped:
+            return 0
+        best = self.evaluate(pos)
+        if best >= beta or ply >= MAX_PLY:
+            return best
+        if best > alpha:
+            alpha = best
+        squares = pos.squares
+        captures = [move for move in pos.gen_moves()
+                    if squares[move % NUM_SQUARES] and not is_losing_capture(pos, move, self.values)]
+        captures.sort(key=lambda move: self.capture_rank(squares, move), reverse=True)
+        for move in captures:
+            pos.make_move(move)
+            score = -self.quiesce(pos, -beta, -alpha, ply + 1)
+            pos.unmake_move()
+            if self.stopped:
+                return 0
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best
+
+    def negamax(self, pos, depth, alpha, beta, ply):
+        if pos.winning is not None:
+            return -MATE + ply
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.quiesce(pos, alpha, beta, ply)
+        self.nodes += 1
+        if self.stop_requested and self.best_move is not None:
+            self.stopped = True
+        if self.nodes & CLOCK_MASK == 0:
+            self.check_budget()
+        if self.stopped:
+            return 0
+        if self.tablebases is not None and ply > 0:
+            result = self.tablebases.probe(pos)
+            if result is not None:
+                value, distance = result
+                if value == WIN:
+                    return MATE - ply - distance
+                if value == LOSS:
+                    return -MATE + ply + distance
+                return 0
+
+        tt_move = None
+        entry = self.tt.get(pos.key)
+        if entry is not None:
+            tt_depth, tt_score, flag, tt_move = entry
+            if tt_depth >= depth and ply > 0:
+                tt_score = score_from_tt(tt_score, ply)
+                if flag == EXACT or (flag == LOWER and tt_score >= beta) or (flag == UPPER and tt_score <= alpha):
+                    return tt_score
+
+        moves = pos.gen_moves()
+        if not moves:
+            # the side to move cannot move and loses
+            return -MATE + ply
+        self.order_moves(pos, moves, ply, tt_move)
+
+        squares = pos.squares
+        original_alpha = alpha
+        best = -INF
+        best_move = None
+        for i, move in enumerate(moves):
+            captured = squares[move % NUM_SQUARES]
+            pos.make_move(move)
+            if i == 0:
+                score = -self.negamax(pos, depth - 1, -beta, -alpha, ply + 1)
+            else:
+                score = -self.negamax(pos, depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self.negamax(pos, depth - 1, -beta, -alpha, ply + 1)
+            pos.unmake_move()
+            if self.stopped:
+                return 0
+            if score > best:
+                best = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        if not captured:
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            self.history[move] += depth * depth
+                        break
+
+        if best <= original_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if len(self.tt) >= self.tt_size:
+            self.tt.clear()
+        self.tt[pos.key] = (depth, score_to_tt(best, ply), flag, best_move)
+        return best
+
+    def search(self, pos, max_depth=4, time_ms=None, max_nodes=None):
+        # Searches pos (which is restored afterwards) by iterative deepening up to max_depth, or until time_ms
+        # milliseconds have passed or max_nodes nodes have been searched. Depth 1 is always finished.
+        # Returns (best move, score, depth), the move is None when the side to move has no move
+        start = time.perf_counter()
+        self.deadline = None if time_ms is None else start + time_ms / 1000
+        self.max_nodes = max_nodes
+        self.stopped = False
+        self.stop_requested = False
+        self.nodes = 0
+        self.best_move = None
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        # keep some of the history of the previous search
+        self.history = [value >> 1 for value in self.history]
+
+        best_score = 0
+        finished_depth = 0
+        for depth in range(1, max_depth + 1):
+            score = self.negamax(pos, depth, -INF, INF, 0)
+            if self.stopped:
+                break
+            entry = self.tt.get(pos.key)
+            if entry is None or entry[3] is None:
+                break
+            self.best_move = entry[3]
+            best_score = score
+            finished_depth = depth
+            if abs(score) >= MATE_BOUND:
+                # a forced win or loss was found, searching deeper will not change it
+                break
+
+        self.elapsed = time.perf_counter() - start
+        if self.verbose:
+            print(f"AlphaBeta: depth {finished_depth}, score {best_score}, {self.nodes} nodes, "
+                  f"{self.nodes / max(self.elapsed, 1e-9):.0f} nodes/s")
+        return self.best_move, best_score, finished_depth
+
+
+# Mate scores are stored in the transposition table relative to the node instead of the root, so that they
+# stay correct when the position is reached at another ply
+def score_to_tt(score, ply):
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
@@ -0,0 +1,187 @@
+# Batched random playouts with NumPy.
+#
+# BatchPlayout plays K random games at once. The games are held as a (K, 10, 9) array of piece codes (see
+# position.py) and all of them advance one ply per step, so the Python overhead of a step is paid once for the
+# whole batch. Since every game starts with the same side to move, that side is shared by the batch.
+#
+# Move generation is vectorised over a table of candidate moves: every (piece code, from square, to square)
+# that the piece could make on an empty board. A candidate is legal in a game when the piece is on its from
+# square, the squares between from and to hold the right number of pieces (none, or exactly one for a cannon
+# capture) and the destination is not an own piece. The in-between squares are the horse leg and the elephant
+# eye, or the squares a chariot or cannon slides over; those are counted with a running sum along the ray
+# instead of being gathered one by one. One legal candidate per game is then picked uniformly at random.
+#
+# The batch only pays off for large K: at K = 500 and 10 plies it is still slower than PlayoutEngine, it catches
+# up on long playouts where the per-ply overhead is shared by many games. At the num_rollout of 50 that MCTSAI
+# uses by default it is a slowdown. The moves are uniformly random (no SEE filtering, see see.py) and the
+# tablebases are not probed during the batch, MCTSAI probes them once at the starting position.
+#
+# Rewards use the same convention as MCTSAI and PlayoutEngine: 1 when black wins, -1 when red wins, the
+# evaluation of the last position when the game is cut off at max_depth (kept up to date per game as the moves
+# are played), and a side that cannot move loses.
+
+import time
+
+import numpy as np
+
+from pieces import ADVISOR_MOVES, ELEPHANT_MOVES, GENERAL_MOVES, HORSE_MOVES, SOLDIER_MOVES
+from evaluation import REWARD_SCALE
+from position import (SCORE, BLACK, RED, COLORS, COLS, ROWS, NUM_SQUARES, GENERAL, ADVISOR, ELEPHANT, HORSE,
+                      CHARIOT, CANNON, SOLDIER, TYPE_MASK, make_code, square)
+
+# candidate kinds: a normal move needs the squares between from and to to be empty, a cannon jump is a quiet move
+# (in-between squares and destination empty) or a capture over exactly one piece
+MOVE, JUMP = 0, 1
+# index of an extra column that is always empty, used when a candidate has no blocking square
+PAD = NUM_SQUARES
+# SCORE as an array, with a zero column for PAD
+SCORE_TABLE = np.zeros((16, NUM_SQUARES + 1), dtype=np.int64)
+SCORE_TABLE[:, :NUM_SQUARES] = SCORE
+
+
+def _candidates(side):
+    # builds the candidate moves of one side, see CANDIDATES
+    color = COLORS[side]
+    rows = []
+
+    def add(piece_type, frm, to, kind, block, ray_pos):
+        rows.append((make_code(piece_type, side), frm, to, kind, block, ray_pos))
+
+    for piece_type, tables in ((ADVISOR, ADVISOR_MOVES[color]), (GENERAL, GENERAL_MOVES[color]),
+                               (SOLDIER, SOLDIER_MOVES[color])):
+        for pos, destinations in tables.items():
+            for to in destinations:
+                add(piece_type, square(pos), square(to), MOVE, PAD, 0)
+    for piece_type, tables in ((HORSE, HORSE_MOVES), (ELEPHANT, ELEPHANT_MOVES[color])):
+        for pos, destinations in tables.items():
+            for to, block in destinations:
+                add(piece_type, square(pos), square(to), MOVE, square(block), 0)
+    # the squares of a ray are added in order, ray_pos is the distance from the slider minus one
+    for frm in range(NUM_SQUARES):
+        row, col = divmod(frm, COLS)
+        for dr, dc in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            r, c = row + dr, col + dc
+            ray_pos = 0
+            while 0 <= r < ROWS and 0 <= c < COLS:
+                to = r * COLS + c
+                add(CHARIOT, frm, to, MOVE, PAD, ray_pos)
+                add(CANNON, frm, to, JUMP, PAD, ray_pos)
+                r, c = r + dr, c + dc
+                ray_pos += 1
+
+    # sorted by (code, from square) so that the candidates of a piece on a square are consecutive, the sort is
+    # stable so the squares of a ray stay consecutive and in order
+    rows.sort(key=lambda row: (row[0], row[1]))
+    codes, frms, tos, kinds, blocks, ray_positions = zip(*rows)
+    groups = np.array(codes, dtype=np.intp) * NUM_SQUARES + np.array(frms, dtype=np.intp)
+    group_count = np.bincount(groups, minlength=16 * NUM_SQUARES)
+    group_start = np.cumsum(group_count) - group_count
+    return (np.array(tos, dtype=np.intp), np.array(kinds, dtype=np.int8), np.array(blocks, dtype=np.intp),
+            np.array(ray_positions, dtype=np.intp), group_start, group_count)
+
+
+# Per side: (to, kind, blocking square, ray position, group start, group count). The candidates of the piece with
+# code c on square sq are the indices group_start[g] to group_start[g] + group_count[g] - 1 for g = c * 90 + sq.
+# A horse or elephant candidate is blocked by a piece on its blocking square; the in-between squares of a
+# chariot or cannon candidate are the destinations of the ray_pos candidates just before it.
+CANDIDATES = (_candidates(RED), _candidates(BLACK))
+
+
+def legal_moves(games, playing, side):
+    # games is a (K, 91) array of piece codes (the last column is always empty) and playing the indices of the
+    # games to look at. Returns (game index, from square, to square) arrays with one entry per legal move of
+    # side, ordered by game
+    tos, kinds, blocks, ray_positions, group_start, group_count = CANDIDATES[side]
+    board = games[playing, :NUM_SQUARES]
+    # the pieces of side, and the range of candidates of each
+    piece_game, piece_square = np.nonzero((board != 0) & ((board >> 3) == side))
+    groups = board[piece_game, piece_square].astype(np.intp) * NUM_SQUARES + piece_square
+    counts = group_count[groups]
+    total = counts.sum()
+    game_idx = np.repeat(playing[piece_game], counts)
+    frm = np.repeat(piece_square, counts)
+    cand_idx = np.repeat(group_start[groups] - (np.cumsum(counts) - counts), counts) + np.arange(total)
+
+    to = tos[cand_idx]
+    target = games[game_idx, to]
+    # number of pieces between from and to: the occupied earlier squares of the ray, or the blocking square
+    occupied = (target != 0).astype(np.intp)
+    before = np.cumsum(occupied) - occupied
+    in_between = before - before[np.arange(total) - ray_positions[cand_idx]]
+    in_between += games[game_idx, blocks[cand_idx]] != 0
+    empty = target == 0
+    enemy = ~empty & ((target >> 3) != side)
+    legal = np.where(kinds[cand_idx] == JUMP,
+                     (empty & (in_between == 0)) | (enemy & (in_between == 1)),
+                     (empty | enemy) & (in_between == 0))
+    return game_idx[legal], frm[legal], to[legal]
+
+
+class BatchPlayout:
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        # statistics
+        self.playouts = 0
+        self.plies = 0
+        self.elapsed = 0.0
+
+    def run(self, pos, k, max_depth):
+        # plays k random games of at most max_depth plies from a Position and returns their rewards
+        boards = np.frombuffer(bytes(pos.squares), dtype=np.int8).reshape(1, ROWS, COLS).repeat(k, axis=0)
+        if pos.winning is not None:
+            return np.full(k, 1.0 if pos.winning == BLACK else -1.0)
+        return self.run_boards(boards, pos.turn, max_depth)
+
+    def run_boards(self, boards, turn, max_depth):
+        # boards is a (K, 10, 9) array of piece codes, all with the same side to move (turn).
+        # Returns the (K,) array of rewards; boards is not modified
+        start = time.perf_counter()
+        k = len(boards)
+        # one extra always-empty column at index PAD
+        games = np.zeros((k, NUM_SQUARES + 1), dtype=np.int8)
+        games[:, :NUM_SQUARES] = boards.reshape(k, NUM_SQUARES)
+        rewards = np.zeros(k)
+        scores = SCORE_TABLE[games, np.arange(NUM_SQUARES + 1)].sum(axis=1)
+        active = np.ones(k, dtype=bool)
+        side = turn
+        for _ in range(max_depth):
+            playing = np.flatnonzero(active)
+            if len(playing) == 0:
+                break
+            game_idx, frm, to = legal_moves(games, playing, side)
+
+            # games without a legal move are lost by the side to move
+            move_count = np.bincount(game_idx, minlength=k)
+            stuck = active & (move_count == 0)
+            rewards[stuck] = 1.0 if side == RED else -1.0
+            active &= ~stuck
+            if len(game_idx) == 0:
+                break
+
+            # pick one legal move per game uniformly, the moves of a game are consecutive
+            playing = np.flatnonzero(active)
+            first = np.cumsum(move_count) - move_count
+            chosen = first[playing] + (self.rng.random(len(playing)) * move_count[playing]).astype(np.intp)
+            game_idx = game_idx[chosen]
+            frm = frm[chosen]
+            to = to[chosen]
+            captured = games[game_idx, to]
+            moved = games[game_idx, frm]
+            scores[game_idx] += SCORE_TABLE[moved, to] - SCORE_TABLE[moved, frm] - SCORE_TABLE[captured, to]
+            games[game_idx, to] = moved
+            games[game_idx, frm] = 0
+            self.plies += len(game_idx)
+
+            won = game_idx[(captured & TYPE_MASK) == GENERAL]
+            rewards[won] = 1.0 if side == BLACK else -1.0
+            active[won] = False
+            side ^= 1
+
+        # the games cut off at max_depth
+        rewards[active] = -np.tanh(scores[active] / REWARD_SCALE)
+        self.playouts += k
+        self.elapsed += time.perf_counter() - start
+        return rewards
+
+    def playouts_per_second(self):
+        return self.playouts / self.elapsed if self.elapsed > 0 else 0.0
@@ -0,0 +1,145 @@
+# Optional bitboard backend for Position.
+#
+# BitboardPosition keeps the occupied squares as two 90 bit Python ints: `occupied` in the usual square order
+# (bit row * 9 + col, so a rank is 9 consecutive bits) and `rotated` in file order (bit col * 10 + row, so a
+# file is 10 consecutive bits). The chariot and cannon moves along a rank or a file then come from lookup
+# tables indexed by the slider's place on the line and the occupancy of the line, instead of walking square by
+# square. Everything else (piece codes, piece lists, keys, undo records) is inherited from Position.
+
+from position import (Position, NUM_SQUARES, COLS, ROWS, TYPE_MASK, CHARIOT, CANNON, GENERATORS)
+
+RANK_MASK = (1 << COLS) - 1
+FILE_MASK = (1 << ROWS) - 1
+
+SQUARE_BIT = tuple(1 << sq for sq in range(NUM_SQUARES))
+ROTATED_BIT = tuple(1 << (sq % COLS * ROWS + sq // COLS) for sq in range(NUM_SQUARES))
+
+
+def _line_table(length, step):
+    # For a slider at index i of a line of `length` squares with occupancy occ (bit j set when the j-th square
+    # of the line is occupied), returns three tables indexed [i][occ]:
+    #   quiet: the empty squares the slider reaches
+    #   first: the first occupied square in each direction (a chariot capture if it is an enemy)
+    #   second: the second occupied square in each direction (a cannon capture if it is an enemy)
+    # Squares are stored as offsets from the slider's square, one step along the line being `step` squares,
+    # so that the destination is sq + offset and the encoded move is sq * (NUM_SQUARES + 1) + offset.
+    quiet = []
+    first = []
+    second = []
+    for i in range(length):
+        quiet_i = []
+        first_i = []
+        second_i = []
+        for occ in range(1 << length):
+            q = []
+            f = []
+            s = []
+            for direction in (1, -1):
+                j = i + direction
+                while 0 <= j < length and not occ >> j & 1:
+                    q.append((j - i) * step)
+                    j += direction
+                if 0 <= j < length:
+                    f.append((j - i) * step)
+                    j += direction
+                    while 0 <= j < length and not occ >> j & 1:
+                        j += direction
+                    if 0 <= j < length:
+                        s.append((j - i) * step)
+            quiet_i.append(tuple(q))
+            first_i.append(tuple(f))
+            second_i.append(tuple(s))
+        quiet.append(tuple(quiet_i))
+        first.append(tuple(first_i))
+        second.append(tuple(second_i))
+    return tuple(quiet), tuple(first), tuple(second)
+
+
+# indexed by the column (for a rank) or the row (for a file) of the slider
+RANK_QUIET, RANK_FIRST, RANK_SECOND = _line_table(COLS, 1)
+FILE_QUIET, FILE_FIRST, FILE_SECOND = _line_table(ROWS, COLS)
+
+
+class BitboardPosition(Position):
+    def __init__(self):
+        Position.__init__(self)
+        self.occupied = 0
+        self.rotated = 0
+
+    def put_square(self, sq, code):
+        Position.put_square(self, sq, code)
+        self.occupied |= SQUARE_BIT[sq]
+        self.rotated |= ROTATED_BIT[sq]
+
+    def clear(self):
+        Position.clear(self)
+        self.occupied = 0
+        self.rotated = 0
+
+    def copy(self):
+        pos = Position.copy(self)
+        pos.occupied = self.occupied
+        pos.rotated = self.rotated
+        return pos
+
+    def make_move(self, move):
+        frm, to = divmod(move, NUM_SQUARES)
+        self.occupied = self.occupied & ~SQUARE_BIT[frm] | SQUARE_BIT[to]
+        self.rotated = self.rotated & ~ROTATED_BIT[frm] | ROTATED_BIT[to]
+        Position.make_move(self, move)
+
+    def unmake_move(self):
+        move, captured = self.undo_stack[-1][:2]
+        frm, to = divmod(move, NUM_SQUARES)
+        self.occupied |= SQUARE_BIT[frm]
+        self.rotated |= ROTATED_BIT[frm]
+        if not captured:
+            self.occupied &= ~SQUARE_BIT[to]
+            self.rotated &= ~ROTATED_BIT[to]
+        Position.unmake_move(self)
+
+    def rank_occupancy(self, row):
+        # 0-based row
+        return self.occupied >> (row * COLS) & RANK_MASK
+
+    def file_occupancy(self, col):
+        # 0-based column
+        return self.rotated >> (col * ROWS) & FILE_MASK
+
+    def gen_moves(self, side=None):
+        if side is None:
+            side = self.turn
+        squares = self.squares
+        moves = []
+        for sq in self.pieces[side]:
+            piece_type = squares[sq] & TYPE_MASK
+            if piece_type == CHARIOT or piece_type == CANNON:
+                self._gen_slider(sq, piece_type, side, moves)
+            else:
+                GENERATORS[piece_type](squares, sq, side, moves)
+        return moves
+
+    def gen_piece_moves(self, sq, out):
+        code = self.squares[sq]
+        piece_type = code & TYPE_MASK
+        if piece_type == CHARIOT or piece_type == CANNON:
+            self._gen_slider(sq, piece_type, code >> 3, out)
+        else:
+            GENERATORS[piece_type](self.squares, sq, code >> 3, out)
+
+    def _gen_slider(self, sq, piece_type, side, moves):
+        squares = self.squares
+        row, col = divmod(sq, COLS)
+        rank = self.occupied >> (row * COLS) & RANK_MASK
+        file = self.rotated >> (col * ROWS) & FILE_MASK
+        base = sq * (NUM_SQUARES + 1)
+        moves.extend([base + d for d in RANK_QUIET[col][rank]])
+        moves.extend([base + d for d in FILE_QUIET[row][file]])
+        if piece_type == CHARIOT:
+            targets = RANK_FIRST[col][rank] + FILE_FIRST[row][file]
+        else:
+            # the cannon jumps over exactly one piece to capture
+            targets = RANK_SECOND[col][rank] + FILE_SECOND[row][file]
+        for d in targets:
+            if squares[sq + d] >> 3 != side:
+                moves.append(base + d)
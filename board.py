@@ -12,9 +12,11 @@ import pygame
 import sys
 import random
 import math
-from pieces import Piece, avail_move
+from pieces import avail_move
 import copy
 from mcts import *
+import rules
+from rules import Piece, SHOWING_POSSIBLE_MOVES, WAITING_FOR_MOVE, AI_MOVING
 
 # Initialize pygame
 pygame.init()
@@ -30,102 +32,14 @@ BACKGROUND_COLOR = (255, 228, 181)  # light beige
 RIVER_TEXT_COLOR = (0, 0, 128)
 FONT_SIZE = 36
 
-# Game States
-SHOWING_POSSIBLE_MOVES = 0
-WAITING_FOR_MOVE = 1
-AI_MOVING = 2
-
 # Setup window
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Chinese Chess Board")
 font = pygame.font.Font("NotoSansSC-VariableFont_wght.ttf", FONT_SIZE)
 
 
-class Piece:
-    def __init__(self, name, color, position):
-        self.name = name
-        self.color = color
-        self.position = position
-        self.selected_piece = None
-        self.selected_avail_moves = []
-
-class Board:
-    def __init__(self):
-        # Initialize the board with all open positions as None, for positions with 0, they are open and would not be used
-        # IMPORTANT: board[i][j] denotes the piece at the ith row and jth column
-        # IMPORTANT: board[i][j] denotes the piece at the ith row and jth column
-        # IMPORTANT: board[i][j] denotes the piece at the ith row and jth column
-        # the board would be used for calculations
-        self.board = [[None for _ in range(COLS + 1)] for _ in range(ROWS + 1)]
-        # initialize all the pieces at the start of the game as alive at their starting positions
-        self.init_piece()
-        self.dead_pieces = []
-        self.put_piece()
-        self.game_state = WAITING_FOR_MOVE
-        self.turn = "red"
-        self.winning = None
-
-    def set_bot(self, bot):
-        self.bot = bot
-
-    def custom_init(self,pieces,dead_pieces,turn,bot):
-        self.pieces = pieces
-        self.dead_pieces = dead_pieces
-        self.put_piece()
-        self.game_state = WAITING_FOR_MOVE
-        self.turn = turn
-        self.winning = None
-        self.bot = bot
-
-    def _switch_turn(self):
-        if self.turn == "red":
-            self.turn = "black"
-        else:
-            self.turn = "red"
-
-    def init_piece(self):
-        pieces = [
-                     Piece("R", "black", (1, 1)),
-                     Piece("H", "black", (1, 2)),
-                     Piece("E", "black", (1, 3)),
-                     Piece("A", "black", (1, 4)),
-                     Piece("G", "black", (1, 5)),
-                     Piece("A", "black", (1, 6)),
-                     Piece("E", "black", (1, 7)),
-                     Piece("H", "black", (1, 8)),
-                     Piece("R", "black", (1, 9)),
-                     Piece("C", "black", (3, 2)),
-                     Piece("C", "black", (3, 8)),
-                     Piece("S", "black", (4, 1)),
-                     Piece("S", "black", (4, 3)),
-                     Piece("S", "black", (4, 5)),
-                     Piece("S", "black", (4, 7)),
-                     Piece("S", "black", (4, 9)),
-                 ] + [
-                     Piece("R", "red", (10, 1)),
-                     Piece("H", "red", (10, 2)),
-                     Piece("E", "red", (10, 3)),
-                     Piece("A", "red", (10, 4)),
-                     Piece("G", "red", (10, 5)),
-                     Piece("A", "red", (10, 6)),
-                     Piece("E", "red", (10, 7)),
-                     Piece("H", "red", (10, 8)),
-                     Piece("R", "red", (10, 9)),
-                     Piece("C", "red", (8, 2)),
-                     Piece("C", "red", (8, 8)),
-                     Piece("S", "red", (7, 1)),
-                     Piece("S", "red", (7, 3)),
-                     Piece("S", "red", (7, 5)),
-                     Piece("S", "red", (7, 7)),
-                     Piece("S", "red", (7, 9)),
-                 ]
-        self.pieces = pieces
-
-    def put_piece(self):
-        # put the pieces on the board
-        for piece in self.pieces:
-            x, y = piece.position
-            self.board[x][y] = piece
+class Board(rules.Board):
+    # pygame front end: drawing and mouse handling on top of the rules in rules.py
 
     def get_position(self, x, y):
         # DRAWING_METHOD: return the position on the pixel graph given a position on the chessboard
@@ -230,24 +144,6 @@ class Board:
         text_rect = text.get_rect(center=(WIDTH / 2, HEIGHT / 2))
         screen.blit(text, text_rect)
 
-    def execute_move(self,piece,move):
-        if piece is not None and move is not None:
-            # move the piece to the new position
-            self.board[piece.position[0]][piece.position[1]] = None
-            piece.position = move[0]
-            self.board[move[0][0]][move[0][1]] = piece
-            # check if any enemy piece is killed
-            if move[1] is not None:
-                self.dead_pieces.append(move[1])
-                self.pieces.remove(move[1])
-                # check if the game is over
-                if move[1].name == "G":
-                    self.winning = self.turn
-            # print("AI moved")
-        else:
-            pass
-            # print("AI cannot move")
-
     def AI_move(self):
         print("AI is moving")
         if self.game_state != AI_MOVING:
@@ -290,17 +186,8 @@ class Board:
             for moves in self.selected_avail_moves:
                 pos = self.get_position(moves[0][0], moves[0][1])
                 if np.sqrt((pos[0] - x) ** 2 + (pos[1] - y) ** 2) < POSSIBLE_MOVE_SIZE:
-                    # move the piece to the new position
-                    self.board[self.selected_piece.position[0]][self.selected_piece.position[1]] = None
-                    self.selected_piece.position = moves[0]
-                    self.board[moves[0][0]][moves[0][1]] = self.selected_piece
-                    # check if any enemy piece is killed
-                    if moves[1] is not None:
-                        self.dead_pieces.append(moves[1])
-                        self.pieces.remove(moves[1])
-                        # check if the game is over
-                        if moves[1].name == "G":
-                            self.winning = self.turn
+                    # move the piece to the new position (execute_move also keeps the position key up to date)
+                    self.execute_move(self.selected_piece, moves)
                     # reset the selected piece and possible moves
                     self.selected_piece = None
                     self.selected_avail_moves = []
@@ -310,13 +197,6 @@ class Board:
                 else:
                     self.game_state = WAITING_FOR_MOVE
 
-    def cannot_move(self):
-        total_moves = []
-        for piece in self.pieces:
-            if piece.color == self.turn:
-                total_moves += avail_move(piece, self.board)
-        return len(total_moves) == 0
-
     def draw_possible_moves(self):
         if self.game_state != SHOWING_POSSIBLE_MOVES:
             return
@@ -353,7 +233,7 @@ class Board:
 def main():
     clock = pygame.time.Clock()
     board = Board()
-    board.set_bot(MCTSAI("black"))
+    board.set_bot(MCTSAI("black", verbose=True))
     board.update()
     while True:
         for event in pygame.event.get():
@@ -0,0 +1,168 @@
+# Opening book.
+#
+# The book is a binary file: a 16 byte header (magic, version, number of records) followed by fixed size
+# records (position key, move, weight, count) sorted by key. A position can have several records, one per book
+# move. The file is opened with mmap and searched with a binary search, so opening a book reads nothing up
+# front, and the processes that open the same book share its pages.
+#
+# Books are built from game records: text files with one game per line, written as moves from the start
+# position in ICCS notation, optionally followed by the result ("1-0" red wins, "0-1" black wins, "1/2-1/2"),
+# or the JSON lines written by selfplay.py.
+# Every move of the first max_ply plies is counted; its weight is 2 for each game the side that played it went
+# on to win, 1 for a draw or a game without result, and 0 for a loss. Lines starting with # are ignored.
+#
+# Usage:
+#   python book.py build games.txt book.bin --max-ply 20 --min-count 2
+#   python book.py probe book.bin --moves "h2e2 h9g7"
+
+import argparse
+import json
+import mmap
+import random
+import struct
+import sys
+
+from position import Position, iccs_to_move, move_to_iccs
+
+MAGIC = b"XQBK"
+VERSION = 1
+HEADER = struct.Struct("<4sII4x")
+# key, move, weight, count
+RECORD = struct.Struct("<QHHI")
+MAX_WEIGHT = 0xFFFF
+MAX_COUNT = 0xFFFFFFFF
+
+RESULTS = {"1-0": 0, "0-1": 1, "1/2-1/2": None}
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an opening book")
+        if len(self.data) != HEADER.size + self.size * RECORD.size:
+            raise ValueError(f"{path} is truncated")
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        self.data.close()
+
+    def record(self, i):
+        return RECORD.unpack_from(self.data, HEADER.size + i * RECORD.size)
+
+    def moves(self, key):
+        # [(move, weight, count)] of a position key, empty when the position is not in the book
+        lo, hi = 0, self.size
+        # first record with a key >= key
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.record(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        moves = []
+        while lo < self.size:
+            record_key, move, weight, count = self.record(lo)
+            if record_key != key:
+                break
+            moves.append((move, weight, count))
+            lo += 1
+        return moves
+
+    def choose(self, key, rng=random):
+        # picks a book move of a position key with a probability proportional to its weight, or returns None
+        moves = [(move, weight) for move, weight, count in self.moves(key) if weight > 0]
+        if not moves:
+            return None
+        pick = rng.randrange(sum(weight for move, weight in moves))
+        for move, weight in moves:
+            pick -= weight
+            if pick < 0:
+                return move
+
+
+def read_games(path):
+    # yields (list of ICCS moves, winning side or None) for every game in a game record file
+    with open(path) as f:
+        for line in f:
+            if line.startswith("{"):
+                # a selfplay.py record
+                game = json.loads(line)
+                yield game["moves"], RESULTS.get(game["result"])
+                continue
+            tokens = line.split()
+            if not tokens or tokens[0].startswith("#"):
+                continue
+            winner = None
+            if tokens[-1] in RESULTS:
+                winner = RESULTS[tokens.pop()]
+            yield tokens, winner
+
+
+def build(game_paths, book_path, max_ply=20, min_count=1):
+    # Builds a book from game record files, keeping the moves played in at least min_count games.
+    # Returns the number of records written. Games stop counting at their first illegal move
+    stats = dict()
+    games = 0
+    for path in game_paths:
+        for moves, winner in read_games(path):
+            games += 1
+            pos = Position.start()
+            for text in moves[:max_ply]:
+                try:
+                    move = iccs_to_move(text)
+                except ValueError:
+                    break
+                if pos.winning is not None or move not in pos.gen_moves():
+                    break
+                if winner is None:
+                    weight = 1
+                else:
+                    weight = 2 if winner == pos.turn else 0
+                entry = stats.setdefault((pos.key, move), [0, 0])
+                entry[0] += weight
+                entry[1] += 1
+                pos.make_move(move)
+
+    records = sorted((key, move, min(weight, MAX_WEIGHT), min(count, MAX_COUNT))
+                     for (key, move), (weight, count) in stats.items() if count >= min_count)
+    with open(book_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    print(f"Book: {len(records)} moves from {games} games written to {book_path}")
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build a book from game record files")
+    build_parser.add_argument("games", nargs="+", help="game record files, one game per line")
+    build_parser.add_argument("book")
+    build_parser.add_argument("--max-ply", type=int, default=20)
+    build_parser.add_argument("--min-count", type=int, default=1)
+    probe_parser = commands.add_parser("probe", help="list the book moves of a position")
+    probe_parser.add_argument("book")
+    probe_parser.add_argument("--moves", default="", help="moves from the start position in ICCS notation")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build(args.games, args.book, args.max_ply, args.min_count)
+        return 0
+    book = OpeningBook(args.book)
+    pos = Position.start()
+    for text in args.moves.split():
+        pos.make_move(iccs_to_move(text))
+    for move, weight, count in book.moves(pos.key):
+        print(f"{move_to_iccs(move)} weight {weight} count {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# Static evaluation: material plus piece-square tables.
+#
+# A piece is worth its material value (PIECE_VALUES, the values MCTSAI.piece_value starts from) plus a bonus
+# for the square it stands on (PIECE_SQUARE_TABLES). Scores are integers in hundredths of a soldier and are
+# from red's point of view: red pieces count positive and black pieces negative. The evaluation of a position
+# is the sum over its pieces, which Position and Board keep up to date in make/unmake (see position.SCORE)
+# instead of adding it up again every time it is needed.
+
+import math
+
+PIECE_VALUES = {
+    "S": 1,  # Soldier before crossing the river
+    "A": 2,  # Advisor
+    "E": 2,  # Elephant
+    "H": 4,  # Horse (Knight)
+    "C": 4.5,  # Cannon
+    "R": 9,  # Chariot (Rook)
+    "G": 100  # General (still set high to prioritize survival)
+}
+SCORE_SCALE = 100
+
+# Bonuses in hundredths of a soldier for red pieces, by row and column of the (row, col) positions of Board:
+# row 1 is black's back rank and row 10 red's. Black pieces use the tables flipped top to bottom.
+PIECE_SQUARE_TABLES = {
+    # a soldier gains most of its value by crossing the river and getting close to the palace
+    "S": [[  0,   0,   0,  10,  20,  10,   0,   0,   0],
+          [ 20,  40,  60,  80,  90,  80,  60,  40,  20],
+          [ 20,  40,  60,  80,  90,  80,  60,  40,  20],
+          [ 20,  30,  50,  60,  70,  60,  50,  30,  20],
+          [ 10,  20,  30,  40,  50,  40,  30,  20,  10],
+          [  0,   0,  10,   0,  20,   0,  10,   0,   0],
+          [  0,   0,   0,   0,  10,   0,   0,   0,   0],
+          [  0,   0,   0,   0,   0,   0,   0,   0,   0],
+          [  0,   0,   0,   0,   0,   0,   0,   0,   0],
+          [  0,   0,   0,   0,   0,   0,   0,   0,   0]],
+    # a horse wants to be developed and central, and is weak on the edge and at home
+    "H": [[  0,  10,  20,  20,  10,  20,  20,  10,   0],
+          [ 10,  20,  40,  30,  20,  30,  40,  20,  10],
+          [ 10,  30,  40,  50,  40,  50,  40,  30,  10],
+          [ 10,  30,  40,  40,  40,  40,  40,  30,  10],
+          [  0,  20,  30,  40,  40,  40,  30,  20,   0],
+          [  0,  20,  30,  30,  30,  30,  30,  20,   0],
+          [  0,  10,  20,  20,  20,  20,  20,  10,   0],
+          [-10,   0,  10,  10,   0,  10,  10,   0, -10],
+          [-10, -10,   0,   0, -10,   0,   0, -10, -10],
+          [-20, -10, -10, -10, -20, -10, -10, -10, -20]],
+    # a chariot wants open files and the enemy's side of the board
+    "R": [[ 10,  20,  10,  20,  20,  20,  10,  20,  10],
+          [ 10,  20,  10,  30,  30,  30,  10,  20,  10],
+          [  0,  10,  10,  20,  20,  20,  10,  10,   0],
+          [  0,  10,  10,  20,  20,  20,  10,  10,   0],
+          [  0,  20,  20,  20,  20,  20,  20,  20,   0],
+          [  0,  10,  10,  10,  10,  10,  10,  10,   0],
+          [  0,  10,   0,  10,  10,  10,   0,  10,   0],
+          [  0,   0,   0,  10,  10,  10,   0,   0,   0],
+          [  0,   0,   0,   0,   0,   0,   0,   0,   0],
+          [-10,   0,   0,   0,   0,   0,   0,   0, -10]],
+    # a cannon is strongest on the central file
+    "C": [[ 10,  10,   0, -10, -10, -10,   0,  10,  10],
+          [  0,   0,   0, -10, -20, -10,   0,   0,   0],
+          [  0,   0,   0,   0,   0,   0,   0,   0,   0],
+          [  0,   0,   0,   0,  10,   0,   0,   0,   0],
+          [  0,   0,   0,   0,  10,   0,   0,   0,   0],
+          [  0,   0,   0,   0,  10,   0,   0,   0,   0],
+          [  0,   0,   0,   0,  10,   0,   0,   0,   0],
+          [  0,  10,   0,  10,  30,  10,   0,  10,   0],
+          [  0,   0,   0,   0,   0,   0,   0,   0,   0],
+          [  0,   0,   0,   0,   0,   0,   0,   0,   0]],
+    # the general is safest on its home square, the advisors and elephants in the middle of the palace
+    "G": [[0] * 9 for _ in range(7)] + [[0, 0, 0, -20, -20, -20, 0, 0, 0],
+                                        [0, 0, 0, -10, -10, -10, 0, 0, 0],
+                                        [0, 0, 0, -10,   0, -10, 0, 0, 0]],
+    "A": [[0] * 9 for _ in range(8)] + [[0, 0, 0, 0, 10, 0, 0, 0, 0],
+                                        [0] * 9],
+    "E": [[0] * 9 for _ in range(7)] + [[0, 0, 0, 0, 10, 0, 0, 0, 0],
+                                        [0] * 9,
+                                        [0] * 9],
+}
+
+# a score of REWARD_SCALE (five soldiers) is worth a rollout reward of about 0.76
+REWARD_SCALE = 500
+
+
+def piece_score(name, color, position):
+    # the signed score of a piece with Piece.name name and color on a (row, col) position
+    row, col = position
+    if color == "black":
+        row = 11 - row
+    score = round(PIECE_VALUES[name] * SCORE_SCALE) + PIECE_SQUARE_TABLES[name][row - 1][col - 1]
+    return score if color == "red" else -score
+
+
+def score_to_reward(score):
+    # converts a score to a rollout reward between -1 and 1 from black's point of view, like the rewards of the
+    # MCTS search (1 when black wins, -1 when red wins)
+    return -math.tanh(score / REWARD_SCALE)
@@ -0,0 +1,100 @@
+# Feature planes for training and running evaluators, with NumPy.
+#
+# encode_batch turns a batch of positions in the binary format of fen.py into a (N, 14, 10, 9) array with one
+# plane per piece type and color: planes 0-6 hold the red general, advisors, elephants, horses, chariots,
+# cannons and soldiers (piece type - 1), planes 7-13 the black ones, with 1 on the squares the pieces stand on
+# and 0 elsewhere. The side to move does not fit in the planes and is written to a separate (N,) array, 0 for
+# red and 1 for black. Both arrays can be given by the caller, in which case they are filled in place (the
+# planes array must be C-contiguous), so a training loop can reuse its buffers.
+#
+# Moves of a policy are numbered over POLICY_MOVES, the (from, to) square pairs that some piece can play on an
+# empty board (a chariot or cannon move along a rank or file, or a horse, elephant or advisor move), which is
+# far fewer than the 90 * 90 pairs of all squares. policy_index gives the number of encoded moves (see
+# position.encode_move) and policy_squares the (from, to) squares of policy numbers.
+
+import numpy as np
+
+from fen import BITMAP_SIZE, POSITION_SIZE, SIDE_BIT, pack_positions
+from position import (COLS, ROWS, NUM_SQUARES, ADVISOR_TABLE, ELEPHANT_TABLE, HORSE_TABLE, BLACK, RED,
+                      TYPE_MASK)
+
+PLANES = 14
+PIECE_TYPES = 7
+
+
+def _policy_moves():
+    pairs = set()
+    for frm in range(NUM_SQUARES):
+        row, col = divmod(frm, COLS)
+        for to in range(NUM_SQUARES):
+            to_row, to_col = divmod(to, COLS)
+            if to != frm and (to_row == row or to_col == col):
+                pairs.add((frm, to))
+        for to, block, move in HORSE_TABLE[frm]:
+            pairs.add((frm, to))
+        for side in (RED, BLACK):
+            for to, block, move in ELEPHANT_TABLE[side][frm]:
+                pairs.add((frm, to))
+            for to, move in ADVISOR_TABLE[side][frm]:
+                pairs.add((frm, to))
+    return sorted(pairs)
+
+
+POLICY_MOVES = _policy_moves()
+POLICY_SIZE = len(POLICY_MOVES)
+POLICY_FROM = np.array([frm for frm, to in POLICY_MOVES], dtype=np.intp)
+POLICY_TO = np.array([to for frm, to in POLICY_MOVES], dtype=np.intp)
+# encoded move -> policy number, -1 for the pairs no piece can play
+POLICY_INDEX = np.full(NUM_SQUARES * NUM_SQUARES, -1, dtype=np.intp)
+POLICY_INDEX[POLICY_FROM * NUM_SQUARES + POLICY_TO] = np.arange(POLICY_SIZE)
+
+# plane of every piece code, -1 for the codes that are not pieces
+PLANE_OF_CODE = np.full(16, -1, dtype=np.intp)
+for _code in range(16):
+    if _code & TYPE_MASK:
+        PLANE_OF_CODE[_code] = (_code >> 3) * PIECE_TYPES + (_code & TYPE_MASK) - 1
+
+
+def encode_batch(data, out=None, turns=None, dtype=np.float32):
+    # data holds N positions in the binary format of fen.py (bytes, or a uint8 array of N * POSITION_SIZE
+    # bytes). Returns (planes, turns), written into out and turns when they are given
+    packed = np.frombuffer(data, dtype=np.uint8).reshape(-1, POSITION_SIZE)
+    n = len(packed)
+    if out is None:
+        out = np.zeros((n, PLANES, ROWS, COLS), dtype=dtype)
+    else:
+        if out.shape != (n, PLANES, ROWS, COLS) or not out.flags.c_contiguous:
+            raise ValueError(f"out must be a C-contiguous array of shape {(n, PLANES, ROWS, COLS)}")
+        out.fill(0)
+    if turns is None:
+        turns = np.zeros(n, dtype=np.int8)
+
+    bits = np.unpackbits(packed[:, :BITMAP_SIZE], axis=1, bitorder="little")
+    turns[:] = bits[:, SIDE_BIT]
+    occupied = bits[:, :NUM_SQUARES].astype(bool)
+    # the codes of the pieces in square order, low nibble first
+    nibbles = packed[:, BITMAP_SIZE:]
+    codes = np.empty((n, 2 * nibbles.shape[1]), dtype=np.uint8)
+    codes[:, 0::2] = nibbles & 0xF
+    codes[:, 1::2] = nibbles >> 4
+    # the k-th occupied square of a position holds its k-th code
+    game, sq = np.nonzero(occupied)
+    rank = np.cumsum(occupied, axis=1)[game, sq] - 1
+    planes = PLANE_OF_CODE[codes[game, rank]]
+    out.reshape(n, PLANES, NUM_SQUARES)[game, planes, sq] = 1
+    return out, turns
+
+
+def encode_positions(positions, out=None, turns=None, dtype=np.float32):
+    # encode_batch for a list of Position objects
+    return encode_batch(pack_positions(positions), out, turns, dtype)
+
+
+def policy_index(moves):
+    # policy numbers of encoded moves (an int or an array of them)
+    return POLICY_INDEX[moves]
+
+
+def policy_squares(indices):
+    # (from squares, to squares) of policy numbers
+    return POLICY_FROM[indices], POLICY_TO[indices]
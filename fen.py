@@ -0,0 +1,147 @@
+# Position notation: FEN strings and a fixed size binary encoding.
+#
+# FEN follows the usual xiangqi convention: the ranks from black's back rank (row 1 of Board) to red's, red
+# pieces in upper case, K A B N R C P for general, advisor, elephant, horse, chariot, cannon and soldier (G E H
+# S are accepted too when parsing), digits for runs of empty squares, then "w" (or "r") for red to move or "b"
+# for black. The remaining fields (unused here) are written as "- - 0 1" and ignored when parsing. A general or
+# advisor outside its palace, an elephant across the river or off its squares, and a soldier behind its starting
+# rank (or between the files it starts on, on its own side) are rejected.
+#
+# The binary encoding takes POSITION_SIZE = 32 bytes per position:
+#   bytes 0-11   a bitmap of the occupied squares, bit sq % 8 of byte sq // 8, and bit 90 (bit 2 of byte 11) set
+#                when black is to move
+#   bytes 12-27  the piece codes (see position.py) of the occupied squares in square order, two per byte, the
+#                first in the low nibble; a position has at most 32 pieces
+#   bytes 28-31  zero
+# Equal positions have equal encodings, so they can be used to deduplicate positions or as dict keys.
+# pack_positions and unpack_positions convert many positions at once.
+
+from position import (Position, RED, BLACK, COLS, ROWS, NUM_SQUARES, EMPTY, GENERAL, ADVISOR, ELEPHANT, SOLDIER,
+                      GENERAL_SQUARES, ADVISOR_SQUARES, ELEPHANT_SQUARES, SOLDIER_SQUARES, make_code, side_of,
+                      type_of)
+
+START_FEN = "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1"
+
+# piece type -> FEN letter of the red piece
+FEN_LETTERS = " KABNRCP"
+TYPE_OF_LETTER = {letter: t for t, letter in enumerate(FEN_LETTERS) if letter != " "}
+# the letters of Piece.name are accepted too
+TYPE_OF_LETTER.update({"G": 1, "E": 3, "H": 4, "S": 7})
+# the squares, by side, of the pieces that cannot stand anywhere: the palace, the own side of the river, and the
+# squares a soldier can reach (move generation and the tablebases rely on these)
+LEGAL_SQUARES = {GENERAL: GENERAL_SQUARES, ADVISOR: ADVISOR_SQUARES, ELEPHANT: ELEPHANT_SQUARES,
+                 SOLDIER: SOLDIER_SQUARES}
+
+POSITION_SIZE = 32
+BITMAP_SIZE = 12
+MAX_PIECES = 32
+SIDE_BIT = NUM_SQUARES
+
+
+def position_to_fen(pos):
+    ranks = []
+    for row in range(ROWS):
+        rank = ""
+        empty = 0
+        for col in range(COLS):
+            code = pos.squares[row * COLS + col]
+            if code == EMPTY:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            letter = FEN_LETTERS[type_of(code)]
+            rank += letter if side_of(code) == RED else letter.lower()
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    return "/".join(ranks) + (" w" if pos.turn == RED else " b") + " - - 0 1"
+
+
+def position_from_fen(fen, position_cls=Position):
+    fields = fen.split()
+    ranks = fields[0].split("/")
+    if len(ranks) != ROWS:
+        raise ValueError(f"Invalid FEN {fen!r}: expected {ROWS} ranks")
+    pos = position_cls()
+    for row, rank in enumerate(ranks):
+        col = 0
+        for char in rank:
+            if char.isdigit():
+                col += int(char)
+                continue
+            piece_type = TYPE_OF_LETTER.get(char.upper())
+            if piece_type is None or col >= COLS:
+                raise ValueError(f"Invalid FEN {fen!r}: bad rank {rank!r}")
+            side = RED if char.isupper() else BLACK
+            sq = row * COLS + col
+            if piece_type in LEGAL_SQUARES and sq not in LEGAL_SQUARES[piece_type][side]:
+                raise ValueError(f"Invalid FEN {fen!r}: {char} cannot stand on rank {row + 1} file {col + 1}")
+            pos.put_square(sq, make_code(piece_type, side))
+            col += 1
+        if col != COLS:
+            raise ValueError(f"Invalid FEN {fen!r}: rank {rank!r} does not have {COLS} squares")
+    side = fields[1] if len(fields) > 1 else "w"
+    if side not in ("w", "r", "b"):
+        raise ValueError(f"Invalid FEN {fen!r}: bad side to move {side!r}")
+    pos.set_turn(BLACK if side == "b" else RED)
+    return pos
+
+
+def board_to_fen(board):
+    return position_to_fen(Position.from_board(board))
+
+
+def board_from_fen(fen):
+    # a new rules.Board with the position of fen
+    return position_from_fen(fen).to_board()
+
+
+def encode_position(pos):
+    # the POSITION_SIZE bytes encoding of a Position
+    data = bytearray(POSITION_SIZE)
+    nibble = 2 * BITMAP_SIZE
+    for sq, code in enumerate(pos.squares):
+        if code == EMPTY:
+            continue
+        if nibble == 2 * (BITMAP_SIZE + MAX_PIECES // 2):
+            raise ValueError(f"A position can have at most {MAX_PIECES} pieces")
+        data[sq >> 3] |= 1 << (sq & 7)
+        data[nibble >> 1] |= code << (4 * (nibble & 1))
+        nibble += 1
+    if pos.turn == BLACK:
+        data[SIDE_BIT >> 3] |= 1 << (SIDE_BIT & 7)
+    return bytes(data)
+
+
+# for every byte value, the bits set in it
+_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+
+
+def decode_position(data, offset=0, position_cls=Position):
+    # the Position of the encoding at data[offset:offset + POSITION_SIZE]
+    pos = position_cls()
+    nibble = 2 * (offset + BITMAP_SIZE)
+    for i in range(BITMAP_SIZE):
+        byte = data[offset + i]
+        if i == SIDE_BIT >> 3:
+            byte &= (1 << (SIDE_BIT & 7)) - 1
+        for bit in _BITS[byte]:
+            code = data[nibble >> 1] >> (4 * (nibble & 1)) & 0xF
+            pos.put_square(8 * i + bit, code)
+            nibble += 1
+    pos.set_turn(BLACK if data[offset + (SIDE_BIT >> 3)] >> (SIDE_BIT & 7) & 1 else RED)
+    return pos
+
+
+def pack_positions(positions):
+    # the encodings of many positions, one after the other
+    return b"".join(encode_position(pos) for pos in positions)
+
+
+def unpack_positions(data, position_cls=Position):
+    # the positions of pack_positions's output
+    if len(data) % POSITION_SIZE:
+        raise ValueError(f"Packed positions must be a multiple of {POSITION_SIZE} bytes")
+    return [decode_position(data, offset, position_cls) for offset in range(0, len(data), POSITION_SIZE)]
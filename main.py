@@ -1 +1,6 @@
-print("Hello, World!")
+# Runs the headless UCCI engine, see ucci.py. The pygame interface is started with board.py
+import sys
+
+from ucci import main
+
+sys.exit(main())
@@ -1,13 +1,19 @@
-import numpy as np
-import pygame
 import sys
 import random
 import math
+import time
 from pieces import Piece, avail_move
 import copy
-from collections import deque
-from mcts import *
-from board import Board
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from playout import PlayoutEngine, tablebase_reward
+from position import RED, BLACK, Position, position_of, decode_move, encode_move, square, move_to_iccs
+from alphabeta import AlphaBeta, MAX_PLY
+from see import piece_values, see
+from evaluation import PIECE_VALUES
+from book import OpeningBook
+from tablebase import TablebaseSet
+from search_stats import SearchStats
 
 # Constants
 ROWS, COLS = 10, 9
@@ -26,40 +32,136 @@ WAITING_FOR_MOVE = 1
 AI_MOVING = 2
 
 class Node:
-    # b is a Board object
-    def __init__(self, b, parent, turn):
-        self.board = b
-        self.parent = parent
+    # Nodes do not keep a board: the search plays the moves leading to a node on the game board itself
+    # with make_move and takes them back with unmake_move. A node is identified by the Zobrist key of its
+    # position, so positions reached through different move orders share one node (see TranspositionTable)
+    def __init__(self, key, turn):
+        self.key = key
+        self.turn = turn
+        # children maps a move ((row, col) from, (row, col) to) to the key of the child node
         self.children = dict()
-        self.num_children = len(self.children)
+        # moves that have no child yet, generated the first time the node is visited
+        self.untried_moves = None
+        # total rollout reward (from black's point of view) and number of rollouts through this node
         self.reward = 0
-        self.turn = turn
-        self.value = 0
-        self.N = 0
         self.n = 0
-        self.tried_moves = set()
+
+
+class TranspositionTable:
+    # Maps position keys to search nodes, turning the search tree into a DAG. It holds at most max_size nodes:
+    # when it is full the least recently used node is dropped. Nodes on the current search path are always
+    # recently used, and a parent whose child was dropped simply expands that move again.
+    def __init__(self, max_size=200000):
+        self.max_size = max_size
+        self.nodes = OrderedDict()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, key):
+        return self.nodes.get(key)
+
+    def touch(self, key):
+        self.nodes.move_to_end(key)
+
+    def prune(self, root_key):
+        # drops every node that cannot be reached from the node of root_key, keeping the LRU order of the rest
+        reachable = set()
+        stack = [root_key]
+        while stack:
+            key = stack.pop()
+            node = self.nodes.get(key)
+            if node is None or key in reachable:
+                continue
+            reachable.add(key)
+            stack.extend(node.children.values())
+        self.nodes = OrderedDict((key, node) for key, node in self.nodes.items() if key in reachable)
+        while len(self.nodes) > self.max_size:
+            self.nodes.popitem(last=False)
+
+    def get_or_create(self, key, turn):
+        node = self.nodes.get(key)
+        if node is not None:
+            self.nodes.move_to_end(key)
+            return node
+        node = Node(key, turn)
+        self.nodes[key] = node
+        if len(self.nodes) > self.max_size:
+            self.nodes.popitem(last=False)
+        return node
 
 class MCTSAI:
-    def __init__(self, color="black"):
+    def __init__(self, color="black", workers=1, batch_rollouts=False, reuse_tree=True, engine="mcts",
+                 see_rollouts=False, book=None, tablebases=None, evaluator=None, search_stats=False, verbose=False):
         self.color = color
-        self.piece_value = {
-            "S": 1,  # Soldier before crossing the river
-            "A": 2,  # Advisor
-            "E": 2,  # Elephant
-            "H": 4,  # Horse (Knight)
-            "C": 4.5,  # Cannon
-            "R": 9,  # Chariot (Rook)
-            "G": 100  # General (still set high to prioritize survival)
-        }
+        # print the moves chosen and a summary of every search, as the game window does. The summaries are in
+        # last_search (and stats) either way
+        self.verbose = verbose
+        # endgame tablebases (a TablebaseSet or the directory of the tables) used by the rollouts and the
+        # alpha-beta search, see tablebase.py
+        if isinstance(tablebases, str):
+            tablebases = TablebaseSet(tablebases)
+        self.tablebases = tablebases
+        # a summary of the last search of move, see mcts and alphabeta_move
+        self.last_search = None
+        # collect a SearchStats in every MCTS search (see search_stats.py), the one of the last search is stats
+        self.search_stats = search_stats
+        self.stats = None
+        # set by stop to end the running search, and the running PUCT search
+        self.stopped = False
+        self.puct = None
+        # opening book (an OpeningBook or the path of a book file) checked before searching, see book.py
+        if isinstance(book, str):
+            book = OpeningBook(book)
+        self.book = book
+        # the search used by move: "mcts", "alphabeta" or "puct"
+        self.engine = engine
+        # keep the search tree between moves, see reuse_tree
+        self.reuse_tree = reuse_tree
+        self.tt = None
+        # number of processes used by the MCTS search, see mcts
+        self.workers = workers
+        # run the rollouts of a leaf as one NumPy batch (see batch_playout.py) instead of one game at a time. The
+        # batch is slower than PlayoutEngine at the default num_rollout of 50 (and still at 500), it only catches up
+        # on long rollouts. Its moves are random, so it cannot be combined with see_rollouts, and the tablebases are
+        # only probed at the leaf the batch starts from
+        if batch_rollouts and see_rollouts:
+            raise ValueError("batch_rollouts cannot be combined with see_rollouts")
+        self.batch_rollouts = batch_rollouts
+        # material values by Piece.name, see evaluation.py
+        self.piece_value = dict(PIECE_VALUES)
+        self.values = piece_values(self.piece_value)
+        # runs the rollouts of the MCTS search, with see_rollouts they avoid losing captures (see see.py)
+        self.see_rollouts = see_rollouts
+        self.playout = PlayoutEngine(values=self.values if see_rollouts else None, tablebases=tablebases)
+        # the alpha-beta search, kept between moves for its transposition table and history
+        self.alphabeta = AlphaBeta(self.piece_value, tablebases=tablebases, verbose=verbose)
+        self.batch_playout = None
+        if batch_rollouts:
+            # numpy is only needed for batched rollouts
+            from batch_playout import BatchPlayout
+            self.batch_playout = BatchPlayout()
+        # leaf evaluator of the PUCT search (see puct.py): an evaluator object, the path of MLPEvaluator weights,
+        # or None for a MaterialEvaluator created on first use
+        self.evaluator = evaluator
 
     def update_board(self, game):
         self.board = game.board
+        self.position = Position.from_board(game)
         self.pieces = [piece for piece in game.pieces if piece.color == self.color]
 
-    def move(self, game):
+    def move(self, game, time_ms=None, max_nodes=None):
         # return self.random_move()
         # return self.greedy_move()
-        return self.mcts(game)
+        # with a time_ms and/or max_nodes budget the search runs until the budget is used up, see search
+        piece, move = self.book_move(game)
+        if piece is not None:
+            return piece, move
+        if self.engine == "alphabeta":
+            return self.alphabeta_move(game, time_ms=time_ms, max_nodes=max_nodes)
+        if self.engine == "puct":
+            return self.puct_move(game, time_ms=time_ms, max_nodes=max_nodes)
+        return self.mcts(game, time_ms=time_ms, max_nodes=max_nodes)
 
     def random_move(self):
         # Select a random piece and a random move
@@ -68,10 +170,10 @@ class MCTSAI:
             moves = avail_move(piece, self.board)
             for move in moves:
                 all_moves.append((piece, move))
-        print(f"AI has {len(all_moves)} moves")
+        self.log(f"AI has {len(all_moves)} moves")
         if len(all_moves) > 0:
             (piece, move) = random.choice(all_moves)
-            print(f"AI selected {piece.name} at {piece.position} to move to {move[0]} and kill {move[1]}")
+            self.log(f"AI selected {piece.name} at {piece.position} to move to {move[0]} and kill {move[1]}")
             return piece, move
         return None, None  # no move available
 
@@ -81,165 +183,397 @@ class MCTSAI:
         for piece in self.pieces:
             moves = avail_move(piece, self.board)
             for move in moves:
-                captured_piece = move[1]
-                score = self.piece_value.get(captured_piece.name, 0) if captured_piece else 0
+                # the material won (or lost) once the exchange on the destination is over, see see.py
+                score = see(self.position, encode_move(square(piece.position), square(move[0])), self.values)
                 if score > best_score:
                     best_score = score
                     best_move = (piece, move)
 
         if best_move:
             piece, move = best_move
-            print(f"[Greedy AI] Moving {piece.name} at {piece.position} to {move[0]} with score {best_score}")
+            self.log(f"[Greedy AI] Moving {piece.name} at {piece.position} to {move[0]} with score {best_score}")
             return piece, move
 
         # fallback if no "best" move
-        print("[Greedy AI] No good move, falling back to random")
+        self.log("[Greedy AI] No good move, falling back to random")
         return self.random_move()
 
+    def book_move(self, game):
+        # returns a move of the opening book as (piece, move), or (None, None) when the position is not in it
+        if self.book is None:
+            return None, None
+        move = self.book.choose(game.key)
+        if move is None:
+            return None, None
+        frm, to = decode_move(move)
+        move = (position_of(frm), position_of(to))
+        # guard against key collisions
+        if move not in self.get_all_moves(game):
+            return None, None
+        self.log(f"[Book] {move_to_iccs(encode_move(frm, to))}")
+        return self.to_piece_move(game, move)
+
+    def alphabeta_move(self, game, max_depth=4, time_ms=None, max_nodes=None):
+        # Returns the move of the alpha-beta search as (piece, move). Without a time_ms or max_nodes budget it
+        # searches max_depth plies deep, with one it deepens until the budget is used up
+        if time_ms is not None or max_nodes is not None:
+            max_depth = MAX_PLY
+        move, score, depth = self.alphabeta.search(Position.from_board(game), max_depth, time_ms, max_nodes)
+        self.last_search = {"engine": "alphabeta", "score": score, "depth": depth, "nodes": self.alphabeta.nodes}
+        if move is None:
+            return None, None
+        frm, to = decode_move(move)
+        return self.to_piece_move(game, (position_of(frm), position_of(to)))
+
+    def puct_move(self, game, num_expand=800, time_ms=None, max_nodes=None, batch_size=16, c_puct=1.5):
+        # Returns the most visited move of the PUCT search as (piece, move). It evaluates num_expand leaves, or
+        # runs within the time_ms/max_nodes budget, batch_size leaves per evaluator call
+        # numpy is only needed for the PUCT search
+        from puct import MaterialEvaluator, MLPEvaluator, PUCTNode, PUCTSearch
+        if self.evaluator is None:
+            self.evaluator = MaterialEvaluator()
+        elif isinstance(self.evaluator, str):
+            self.evaluator = MLPEvaluator(self.evaluator)
+        if time_ms is None and max_nodes is None:
+            max_nodes = num_expand
+        search = self.puct = PUCTSearch(self.evaluator, c_puct, batch_size)
+        root = search.run(PUCTNode(), Position.from_board(game), time_ms, max_nodes)
+        self.puct = None
+        stats = search.root_stats(root)
+        self.log(f"PUCT: {search.evaluations} evaluations in {search.batches} batches, "
+                 f"{search.evaluations / search.elapsed if search.elapsed > 0 else 0:.0f} evaluations/s")
+        self.last_search = {"engine": "puct", "visits": sum(visits for visits, value in stats.values()),
+                            "evaluations": search.evaluations, "batches": search.batches}
+        move = search.best_move(root)
+        if move is None:
+            return None, None
+        visits, value = stats.get(move, (0, 0.0))
+        self.last_search["best_visits"] = visits
+        self.last_search["best_value"] = value
+        frm, to = decode_move(move)
+        return self.to_piece_move(game, (position_of(frm), position_of(to)))
+
+    def stop(self):
+        # can be called from another thread to end the running search early, which then returns the best move
+        # found so far (see ucci.py). Searches in worker processes are not stopped
+        self.stopped = True
+        self.alphabeta.stop()
+        puct = self.puct
+        if puct is not None:
+            puct.stop()
+
+    def log(self, text):
+        if self.verbose:
+            print(text)
+
     def swap_turn(self,turn):
         return "black" if turn == "red" else "red"
 
-    def ucb1(self,node,c=2):
-        return node.reward/(node.n + 1e-10) + c * math.sqrt(math.log(node.N + math.e + 1e-6)/(node.n + 1e-10))
-
-    def get_all_moves(self,node):
-        all_moves = set()
-        for piece in node.board.pieces:
-            if piece.color == node.turn:
-                for move in avail_move(piece,node.board.board):
-                    all_moves.add((piece,move))
+    def ucb1(self,node,parent,c=2):
+        if node.n == 0:
+            return float("inf")
+        # rewards are from black's point of view, flip them when red made the move leading to node
+        mean = node.reward/node.n
+        if node.turn == "black":
+            mean = -mean
+        return mean + c * math.sqrt(math.log(parent.n + 1)/node.n)
+
+    def get_all_moves(self,game):
+        # moves as ((row, col) from, (row, col) to) pairs, which stay valid whichever piece objects are involved
+        all_moves = []
+        for piece in game.pieces:
+            if piece.color == game.turn:
+                for move in avail_move(piece,game.board):
+                    all_moves.append((piece.position,move[0]))
         return all_moves
 
-    # Need to differentiate between colors/turn?
-    def selection(self,node):
-        if len(node.children) == 0:
-            return node
-        max_ucb = 0
-        selected_move = None
-        for (piece,move) in node.children:
-            cur_ucb = self.ucb1(node.children[(piece,move)])
-            if max_ucb < cur_ucb:
-                max_ucb = cur_ucb
-                selected_move = (piece,move)
-        return self.selection(node.children[selected_move])
-
-    def expand(self,node):
-        untried_moves = self.get_all_moves(node) - node.tried_moves
-        rand_move = random.choice(list(untried_moves))
-        node.tried_moves.add(rand_move)
-        child_board = self.simulate_move(node.board,rand_move[0],rand_move[1])
-        child = Node(child_board,node,self.swap_turn(node.turn))
-        node.children.update({rand_move : child})
+    def to_piece_move(self,game,move):
+        # converts a ((row, col), (row, col)) move to the (piece, move) form used by Board
+        (x, y), to = move
+        return game.board[x][y], (to, game.board[to[0]][to[1]])
+
+    def play(self,game,move):
+        game.make_move(*self.to_piece_move(game,move))
+
+    def selection(self,node,game):
+        # Walks down from node, playing the selected moves on game, until it reaches a node that still has
+        # untried moves, a finished game or a position already on the path. Returns the nodes on the path
+        path = [node]
+        on_path = {node.key}
+        while game.winning is None:
+            if node.untried_moves is None:
+                node.untried_moves = self.get_all_moves(game)
+            max_ucb = -float("inf")
+            selected_move = None
+            selected_child = None
+            for move, child_key in list(node.children.items()):
+                child = self.tt.get(child_key)
+                if child is None:
+                    # dropped from the transposition table, expand it again
+                    del node.children[move]
+                    node.untried_moves.append(move)
+                    continue
+                cur_ucb = self.ucb1(child,node)
+                if max_ucb < cur_ucb:
+                    max_ucb = cur_ucb
+                    selected_move = move
+                    selected_child = child
+            if node.untried_moves or selected_child is None:
+                break
+            self.play(game,selected_move)
+            self.tt.touch(selected_child.key)
+            node = selected_child
+            path.append(node)
+            if node.key in on_path:
+                break
+            on_path.add(node.key)
+        return path
+
+    def expand(self,node,game):
+        # plays a random untried move of node on game and returns the child node, or None if there is none
+        if game.winning is not None or not node.untried_moves:
+            return None
+        moves = node.untried_moves
+        i = random.randrange(len(moves))
+        moves[i], moves[-1] = moves[-1], moves[i]
+        rand_move = moves.pop()
+        self.play(game,rand_move)
+        child = self.tt.get_or_create(game.key,game.turn)
+        node.children[rand_move] = child.key
         return child
 
-    def rollout(self,depth, max_depth, node):
-        if node.board.winning is not None:
-            if node.board.winning == "black":
-                return 1
-            elif node.board.winning == "red":
-                return -1
-            else:
-                return 0
-        if depth >= max_depth:
-            return 0.5
-        all_moves = self.get_all_moves(node)
-        rand_move = random.choice(list(all_moves))
-        new_board = self.simulate_move(node.board,rand_move[0],rand_move[1])
-        new_node = Node(new_board,node,self.swap_turn(node.turn))
-        reward = self.rollout(depth + 1, max_depth, new_node)
-
-        return reward
-
-    def backtrack(self,node,reward):
-        node.n += 1
-        node.reward += reward
-        cur_node = node
-        while cur_node.parent is not None:
-            cur_node.N += 1
-            cur_node = cur_node.parent
-
-    def equals(self,p1,p2):
-        return p1.name == p2.name and p1.color == p2.color and p1.position == p2.position
+    def backtrack(self,path,reward,visits):
+        # a position can appear twice on a path that ends in a repetition, count it once
+        for node in set(path):
+            node.n += visits
+            node.reward += reward
 
     def tostring(self,p):
         if p is None:
             return "None"
         return f"Piece({p.name}, {p.color},{p.position})"
 
-    def simulate_move(self,game,piece,move):
-        # Given the current board (game), and a move (piece,move), creates a new board object after the move is executed.
-
-        # dead_pieces2 is a deep copy of game.dead_pieces
-        dead_pieces2 = copy.deepcopy(game.dead_pieces)
-        # dead_pieces2 = []
-        # for i in range(len(game.dead_pieces)):
-        #     dead_pieces2[i] = game.dead_pieces[i]
-        pieces2 = copy.deepcopy(game.pieces)
-
-        tmp_piece = piece
-        tmp_move = move
-        for p in pieces2:
-            if self.equals(p,piece):
-                tmp_piece = p
-            if move[1] is not None:
-                if self.equals(p,move[1]):
-                    tmp_move = (move[0],p)
-
-        new_board = Board()
-        for x in range(ROWS + 1):
-            for y in range(COLS + 1):
-                new_board.board[x][y] = None
-
-        new_board.custom_init(pieces2,dead_pieces2,game.turn,self)
-        new_board.execute_move(tmp_piece,tmp_move)
-        new_board.put_piece()
-        new_board.turn = self.swap_turn(game.turn)
-        return new_board
-
-
-    def mcts(self, game, num_expand=100, num_rollout=50, rollout_depth = 10):
-        # Creates a tree structure with current board (game) as the root with depth num_iter.
-        # From a node n1, all possible next moves are simulated, and the resulting board state is stored in the
-        # dictionary n1.children
+    def search(self, game, num_expand=100, num_rollout=50, rollout_depth = 10, tt_size=200000, time_ms=None,
+               max_nodes=None):
+        # Builds a search DAG with the current board (game) as the root and returns the root node. Every iteration
+        # selects a path with UCB1, expands one new move at its end, runs num_rollout random rollouts from there
+        # and adds the results to every node on the path. Positions are looked up in a transposition table by
+        # their Zobrist key.
+        #
+        # The search runs num_expand iterations, unless a budget is given: then it runs until time_ms milliseconds
+        # have passed or max_nodes iterations (each expands at most one node) are done, whichever comes first.
+        # Either way it stops early once the most visited root move cannot be overtaken in the iterations that
+        # are left, and it always runs at least one iteration.
 
         # game is a Board object
-        best_score = -float("inf")
-        best_move = None
-        q = deque()
-
-        # Do I need a visited set? Not sure...
-        visited = set()
-        root = Node(game, None, game.turn)
-        for piece in game.pieces:
-            if piece.color == root.turn:
-                moves = avail_move(piece,game.board)
-                for move in moves:
-                    child_board = self.simulate_move(game,piece,move)
-                    child_turn = self.swap_turn(game.turn)
-                    child = Node(child_board,root,child_turn)
-                    root.children.update({(piece,move) : child})
-
-        for exp_iter in range(num_expand):
-            print(exp_iter)
-            start_node = self.selection(root)
-            new_node = self.expand(start_node)
+        # the search plays its moves on game itself and restores it after every iteration
+        start = time.perf_counter()
+        if time_ms is None and max_nodes is None:
+            max_nodes = num_expand
+        deadline = None if time_ms is None else start + time_ms / 1000
+        base_depth = len(game.undo_stack)
+        self.tt = self.reused_tree(game, tt_size)
+        root = self.tt.get_or_create(game.key, game.turn)
+        reused = root.n
+        self.stopped = False
+        playout = self.batch_playout if self.batch_playout is not None else self.playout
+        stats = self.stats = SearchStats() if self.search_stats else None
+        if stats is not None:
+            stats.reused_visits = reused
+            times = stats.times
+            clock = time.perf_counter
+
+        exp_iter = 0
+        while True:
+            if stats is not None:
+                t0 = clock()
+                plies = playout.plies
+            path = self.selection(root, game)
+            if stats is not None:
+                t1 = clock()
+            new_node = self.expand(path[-1], game)
+            if new_node is not None:
+                path.append(new_node)
+            if stats is not None:
+                t2 = clock()
             net_reward = 0
-            old_pieces = new_node.board.pieces
-            for rollout_iter in range(num_rollout):
-                reward = self.rollout(0, rollout_depth, new_node)
-                after_rollout_pieces = new_node.board.pieces
-                assert old_pieces == after_rollout_pieces
-                old_pieces = after_rollout_pieces
-                net_reward += reward
-
-            self.backtrack(new_node,net_reward)
-
-        max_ucb = 0
+            self.playout.load(game)
+            if self.batch_playout is not None:
+                net_reward = self.batch_reward(num_rollout, rollout_depth)
+            else:
+                for rollout_iter in range(num_rollout):
+                    net_reward += self.playout.run(rollout_depth)
+            if stats is not None:
+                t3 = clock()
+
+            self.backtrack(path,net_reward,num_rollout)
+            while len(game.undo_stack) > base_depth:
+                game.unmake_move()
+            exp_iter += 1
+            if stats is not None:
+                t4 = clock()
+                times["selection"] += t1 - t0
+                times["expansion"] += t2 - t1
+                times["rollout"] += t3 - t2
+                times["backprop"] += t4 - t3
+                stats.add_iteration(len(path) - 1, new_node is not None, num_rollout, playout.plies - plies,
+                                    len(self.tt))
+
+            if self.stopped:
+                break
+            # number of iterations left in the budget
+            remaining = float("inf")
+            if max_nodes is not None:
+                remaining = max_nodes - exp_iter
+            if deadline is not None:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                remaining = min(remaining, (deadline - now) * exp_iter / (now - start))
+            if remaining <= 0 or self.decided(root, remaining * num_rollout):
+                break
+
+        if stats is not None:
+            stats.elapsed = time.perf_counter() - start
+            stats.root_visits = {move_to_iccs(encode_move(square(frm), square(to))): visits
+                                 for (frm, to), (visits, reward) in self.root_stats(root).items()}
+        self.log(f"MCTS: {exp_iter} iterations ({reused} rollouts reused), {playout.playouts} playouts, "
+                 f"{playout.playouts_per_second():.0f} playouts/s")
+        return root
+
+    def reused_tree(self, game, tt_size):
+        # Returns the transposition table to search game with. The nodes of the previous search are keyed by
+        # position, so after the AI's move and the opponent's reply the new position is the grandchild of the old
+        # root if that reply was explored: its subtree is kept with its statistics and the rest is dropped.
+        # Otherwise the search starts from an empty table
+        if not self.reuse_tree or self.tt is None or self.tt.get(game.key) is None:
+            return TranspositionTable(tt_size)
+        self.tt.max_size = tt_size
+        self.tt.prune(game.key)
+        return self.tt
+
+    def decided(self, root, visits_left):
+        # True when no other root move can catch up with the most visited one in visits_left more visits
+        counts = sorted((visits for visits, reward in self.root_stats(root).values()), reverse=True)
+        if not counts:
+            return False
+        if len(counts) == 1 and not root.untried_moves:
+            # the only move
+            return True
+        # an untried move starts from zero visits
+        runner_up = counts[1] if len(counts) > 1 else 0
+        return counts[0] - runner_up > visits_left
+
+    def root_stats(self, root):
+        # {move: (visits, total reward)} of the root's children
+        stats = dict()
+        for move, child_key in root.children.items():
+            child = self.tt.get(child_key)
+            if child is not None:
+                stats[move] = (child.n, child.reward)
+        return stats
+
+    def best_move(self, game, stats):
+        # play the most visited move
+        most_visits = -1
         selected_move = None
-        for (piece,move) in root.children:
-            cur_ucb = self.ucb1(root.children[(piece,move)])
-            if cur_ucb > max_ucb:
-                selected_move = (piece,move)
-                max_ucb = cur_ucb
-
-        return selected_move
\ No newline at end of file
+        for move, (visits, reward) in stats.items():
+            if visits > most_visits:
+                selected_move = move
+                most_visits = visits
+
+        if selected_move is None:
+            return None, None
+        return self.to_piece_move(game, selected_move)
+
+    def parallel_root_stats(self, game, workers, num_expand, num_rollout, rollout_depth, tt_size, time_ms=None,
+                            max_nodes=None):
+        # Root parallel search: every worker process runs its own search (of num_expand iterations, or within the
+        # time_ms/max_nodes budget) from the same position with a different random seed, and the statistics of the
+        # root moves are added up
+        pos = Position.from_board(game)
+        seeds = [random.getrandbits(32) for _ in range(workers)]
+        futures = [get_pool(workers).submit(search_worker, pos, self.color, seed, num_expand, num_rollout,
+                                            rollout_depth, tt_size, time_ms, max_nodes, self.worker_options())
+                   for seed in seeds]
+        stats = dict()
+        for future in futures:
+            for move, (visits, reward) in future.result().items():
+                total_visits, total_reward = stats.get(move, (0, 0))
+                stats[move] = (total_visits + visits, total_reward + reward)
+        return stats
+
+    def batch_reward(self, num_rollout, rollout_depth):
+        # total reward of num_rollout batched rollouts from the scratch position of self.playout. A leaf found in
+        # the tablebases gets the table's reward for every rollout, as PlayoutEngine.run would give at its first ply
+        scratch = self.playout.scratch
+        tablebases = self.tablebases
+        if tablebases is not None and len(scratch.pieces[RED]) + len(scratch.pieces[BLACK]) <= tablebases.max_pieces:
+            result = tablebases.probe(scratch)
+            if result is not None:
+                return tablebase_reward(scratch.turn, result[0]) * num_rollout
+        return float(self.batch_playout.run(scratch, num_rollout, rollout_depth).sum())
+
+    def worker_options(self):
+        # the constructor options that the searches of the worker processes need, see search_worker
+        options = {"see_rollouts": self.see_rollouts, "batch_rollouts": self.batch_rollouts}
+        if self.tablebases is not None:
+            # the workers open the tables of the directory themselves
+            options["tablebases"] = self.tablebases.directory
+        return options
+
+    def mcts(self, game, num_expand=100, num_rollout=50, rollout_depth = 10, tt_size=200000, workers=None,
+             time_ms=None, max_nodes=None):
+        # Returns the move to play as (piece, move): the best move found when the search stops, see search for the
+        # time_ms and max_nodes budget. With more than one worker the search runs in a process pool, and
+        # num_expand and max_nodes are the iterations of each worker
+        if workers is None:
+            workers = self.workers
+        if workers > 1:
+            # the statistics of the worker processes are not collected
+            self.stats = None
+            stats = self.parallel_root_stats(game, workers, num_expand, num_rollout, rollout_depth, tt_size,
+                                             time_ms, max_nodes)
+        else:
+            root = self.search(game, num_expand, num_rollout, rollout_depth, tt_size, time_ms, max_nodes)
+            stats = self.root_stats(root)
+        self.last_search = {"engine": "mcts", "visits": sum(visits for visits, reward in stats.values())}
+        if self.stats is not None:
+            self.last_search["stats"] = self.stats.to_dict()
+        if stats:
+            # visits and mean reward (from black's point of view) of the most visited move
+            visits, reward = max(stats.values(), key=lambda entry: entry[0])
+            self.last_search["best_visits"] = visits
+            self.last_search["best_reward"] = reward / visits if visits else 0.0
+        return self.best_move(game, stats)
+
+
+# the tablebases opened by a worker process, by directory
+_worker_tablebases = dict()
+
+# Process pools of the root parallel search, by number of workers. They are kept at module level so that they
+# are reused between moves (and so that MCTSAI objects stay picklable)
+_pools = dict()
+
+
+def get_pool(workers):
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return _pools[workers]
+
+
+def search_worker(pos, color, seed, num_expand, num_rollout, rollout_depth, tt_size, time_ms=None, max_nodes=None,
+                  options=None):
+    # runs in a worker process of the root parallel search, returns the root statistics. options are the
+    # MCTSAI constructor options of MCTSAI.worker_options
+    random.seed(seed)
+    options = dict(options or ())
+    directory = options.get("tablebases")
+    if isinstance(directory, str):
+        if directory not in _worker_tablebases:
+            _worker_tablebases[directory] = TablebaseSet(directory)
+        options["tablebases"] = _worker_tablebases[directory]
+    ai = MCTSAI(color, **options)
+    ai.playout.rng.seed(seed)
+    root = ai.search(pos.to_board(), num_expand, num_rollout, rollout_depth, tt_size, time_ms, max_nodes)
+    return ai.root_stats(root)
@@ -0,0 +1,194 @@
+# Perft: counts the leaf nodes of the move generation tree to a fixed depth.
+#
+# Used to check that a move generator is correct (the counts must match the reference numbers below, which
+# were produced by pieces.avail_move) and to measure its speed in nodes per second. Every move generator is
+# wrapped in a backend with the same small interface, so new backends only need an entry in BACKENDS.
+#
+# The counts follow the rules of this game: there is no check, a game ends when a general is captured, so
+# positions where a general has just been captured have no moves.
+#
+# Usage:
+#   python perft.py --depth 3                        perft from the start position with every backend
+#   python perft.py --depth 3 --backend bitboard --divide --moves "h2e2 h9g7"
+#   python perft.py --check                          compare every backend against the reference counts
+
+import argparse
+import sys
+import time
+
+from bitboard import BitboardPosition
+from pieces import avail_move
+from position import Position, iccs_to_move, move_to_iccs, decode_move, encode_move, square
+from rules import Board
+
+# name -> (moves from the start position in ICCS notation, {depth: leaf nodes})
+REFERENCE_POSITIONS = {
+    "start": ("", {1: 44, 2: 1926, 3: 80288, 4: 3343044}),
+    "central cannon": ("h2e2 h9g7", {1: 35, 2: 1428, 3: 51511, 4: 2108353}),
+    "open files": ("b2b9 a9b9 h2h9 i9h9", {1: 20, 2: 844, 3: 18212, 4: 806120}),
+    "middle game": ("h2e2 h9g7 h0g2 i9h9 i0h0 b9c7 h0h6 c6c5 h6g6 b7b3", {1: 33, 2: 1296, 3: 46250, 4: 1893319}),
+}
+
+
+class PositionBackend:
+    # Position and its subclasses: moves are encoded ints
+    def __init__(self, position_cls):
+        self.position_cls = position_cls
+
+    def setup(self, moves):
+        pos = self.position_cls.start()
+        for text in moves.split():
+            move = iccs_to_move(text)
+            if move not in pos.gen_moves():
+                raise ValueError(f"Illegal move {text}")
+            pos.make_move(move)
+        return pos
+
+    def moves(self, pos):
+        if pos.winning is not None:
+            return []
+        return pos.gen_moves()
+
+    def make(self, pos, move):
+        pos.make_move(move)
+
+    def unmake(self, pos):
+        pos.unmake_move()
+
+    def perft(self, pos, depth):
+        if depth == 0:
+            return 1
+        if pos.winning is not None:
+            return 0
+        moves = pos.gen_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            pos.make_move(move)
+            nodes += self.perft(pos, depth - 1)
+            pos.unmake_move()
+        return nodes
+
+    def move_name(self, move):
+        return move_to_iccs(move)
+
+
+class BoardBackend:
+    # rules.Board with pieces.avail_move: moves are (piece, (position, captured piece)) like everywhere else
+    def setup(self, moves):
+        board = Board()
+        for text in moves.split():
+            frm, to = decode_move(iccs_to_move(text))
+            legal = {encode_move(square(piece.position), square(move[0])): (piece, move)
+                     for piece, move in self.moves(board)}
+            if encode_move(frm, to) not in legal:
+                raise ValueError(f"Illegal move {text}")
+            board.make_move(*legal[encode_move(frm, to)])
+        return board
+
+    def moves(self, board):
+        if board.winning is not None:
+            return []
+        return [(piece, move) for piece in board.pieces if piece.color == board.turn
+                for move in avail_move(piece, board.board)]
+
+    def make(self, board, move):
+        board.make_move(*move)
+
+    def unmake(self, board):
+        board.unmake_move()
+
+    def perft(self, board, depth):
+        if depth == 0:
+            return 1
+        moves = self.moves(board)
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for piece, move in moves:
+            board.make_move(piece, move)
+            nodes += self.perft(board, depth - 1)
+            board.unmake_move()
+        return nodes
+
+    def move_name(self, move):
+        piece, (to, captured) = move
+        return move_to_iccs(encode_move(square(piece.position), square(to)))
+
+
+BACKENDS = {
+    "pieces": BoardBackend(),
+    "position": PositionBackend(Position),
+    "bitboard": PositionBackend(BitboardPosition),
+}
+
+
+def divide(backend, state, depth):
+    # perft split by root move, returns a list of (move name, leaf nodes)
+    result = []
+    for move in backend.moves(state):
+        name = backend.move_name(move)
+        backend.make(state, move)
+        result.append((name, backend.perft(state, depth - 1)))
+        backend.unmake(state)
+    return result
+
+
+def run(backend_name, depth, moves="", show_divide=False, out=sys.stdout):
+    # runs perft and reports the node count and speed, returns the node count
+    backend = BACKENDS[backend_name]
+    state = backend.setup(moves)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(backend, state, depth)
+        for name, nodes in sorted(counts):
+            print(f"{name}: {nodes}", file=out)
+        nodes = sum(nodes for _, nodes in counts)
+    else:
+        nodes = backend.perft(state, depth)
+    elapsed = time.perf_counter() - start
+    print(f"{backend_name:>9} depth {depth}: {nodes} nodes in {elapsed:.3f}s "
+          f"({nodes / max(elapsed, 1e-9):,.0f} nodes/s)", file=out)
+    return nodes
+
+
+def check(backend_names, max_depth, out=sys.stdout):
+    # compares the backends against REFERENCE_POSITIONS, returns True when every count matches
+    ok = True
+    for backend_name in backend_names:
+        for name, (moves, counts) in REFERENCE_POSITIONS.items():
+            for depth, expected in sorted(counts.items()):
+                if depth > max_depth:
+                    continue
+                print(f"[{name}] ", end="", file=out)
+                nodes = run(backend_name, depth, moves, out=out)
+                if nodes != expected:
+                    print(f"MISMATCH: expected {expected}", file=out)
+                    ok = False
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move generation perft: correctness check and benchmark")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--backend", choices=sorted(BACKENDS) + ["all"], default="all")
+    parser.add_argument("--moves", default="", help="moves from the start position in ICCS notation")
+    parser.add_argument("--position", choices=sorted(REFERENCE_POSITIONS),
+                        help="start from one of the reference positions instead of --moves")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--check", action="store_true",
+                        help="check the reference positions up to --depth against the stored counts")
+    args = parser.parse_args(argv)
+
+    backend_names = sorted(BACKENDS) if args.backend == "all" else [args.backend]
+    if args.check:
+        return 0 if check(backend_names, args.depth) else 1
+    moves = REFERENCE_POSITIONS[args.position][0] if args.position else args.moves
+    for backend_name in backend_names:
+        run(backend_name, args.depth, moves, args.divide)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,6 +26,60 @@ class Piece:
 def verify(pos):
     return pos[0] in range(1,11) and pos[1] in range(1,10)
 
+# Move tables for the pieces that jump to nearby squares, built once at import.
+# Every table maps a position to the tuple of positions the piece could reach on an empty board;
+# the horse and elephant tables also give the square that blocks the move when occupied
+# (the "horse leg" and the "elephant eye"). The side specific tables are indexed by color first.
+ALL_POSITIONS = [(x,y) for x in range(1,11) for y in range(1,10)]
+ADVISOR_POSITIONS = {"red": [(10,4),(10,6),(9,5),(8,4),(8,6)],
+                     "black": [(1,4),(1,6),(2,5),(3,4),(3,6)]}
+GENERAL_POSITIONS = {"red": [(x,y) for x in range(8,11) for y in range(4,7)],
+                     "black": [(x,y) for x in range(1,4) for y in range(4,7)]}
+ELEPHANT_POSITIONS = {"red": [(10,3),(10,7),(8,1),(8,5),(8,9),(6,3),(6,7)],
+                      "black": [(1,3),(1,7),(3,1),(3,5),(3,9),(5,3),(5,7)]}
+
+def _horse_moves(pos):
+    moves = []
+    for dx, dy in [(0,1),(0,-1),(-1,0),(1,0)]:
+        leg = (pos[0]+dx, pos[1]+dy)
+        if not verify(leg):
+            continue
+        for side in (1,-1):
+            dest = (pos[0]+2*dx+(side if dx == 0 else 0), pos[1]+2*dy+(side if dy == 0 else 0))
+            if verify(dest):
+                moves.append((dest, leg))
+    return tuple(moves)
+
+def _elephant_moves(pos, color):
+    moves = []
+    for dx, dy in [(1,1),(1,-1),(-1,1),(-1,-1)]:
+        dest = (pos[0]+2*dx, pos[1]+2*dy)
+        if dest in ELEPHANT_POSITIONS[color]:
+            moves.append((dest, (pos[0]+dx, pos[1]+dy)))
+    return tuple(moves)
+
+def _step_moves(pos, directions, allowed):
+    return tuple((pos[0]+dx, pos[1]+dy) for dx, dy in directions if (pos[0]+dx, pos[1]+dy) in allowed)
+
+def _soldier_moves(pos, color):
+    if color == "red":
+        # the soldier can also move sideways once it has crossed the river
+        directions = [(-1,0)] if pos[0] > 5 else [(-1,0),(0,1),(0,-1)]
+    else:
+        directions = [(1,0)] if pos[0] < 6 else [(1,0),(0,1),(0,-1)]
+    return _step_moves(pos, directions, ALL_POSITIONS)
+
+HORSE_MOVES = {pos: _horse_moves(pos) for pos in ALL_POSITIONS}
+ELEPHANT_MOVES = {color: {pos: _elephant_moves(pos, color) for pos in ELEPHANT_POSITIONS[color]}
+                  for color in ("red", "black")}
+ADVISOR_MOVES = {color: {pos: _step_moves(pos, [(1,1),(1,-1),(-1,1),(-1,-1)], ADVISOR_POSITIONS[color])
+                         for pos in ADVISOR_POSITIONS[color]}
+                 for color in ("red", "black")}
+GENERAL_MOVES = {color: {pos: _step_moves(pos, [(1,0),(-1,0),(0,1),(0,-1)], GENERAL_POSITIONS[color])
+                         for pos in GENERAL_POSITIONS[color]}
+                 for color in ("red", "black")}
+SOLDIER_MOVES = {color: {pos: _soldier_moves(pos, color) for pos in ALL_POSITIONS} for color in ("red", "black")}
+
 def avail_move(piece, board):
     # return a list of tuples:
     # the first element of the tuple is the position of the piece (another tuple)
@@ -51,46 +105,23 @@ def avail_move(piece, board):
 
 
 
-def avail_move_advisor(piece, board):
-    if piece.color == "red":
-        all_possible_pos = [(10,4),(10,6),(9,5),(8,4),(8,6)]
-    else:
-        all_possible_pos = [(1,4),(1,6),(2,5),(3,4),(3,6)]
-    assert piece.position in all_possible_pos
-    # check if the position is occupied by the same color
-    all_directions =  [(piece.position[0]+1, piece.position[1]+1), \
-                (piece.position[0]+1, piece.position[1]-1), \
-                  (piece.position[0]-1, piece.position[1]+1), \
-                    (piece.position[0]-1, piece.position[1]-1)]
-    # filter out cases when going out of the palace
-    all_directions = [pos for pos in all_directions if pos in all_possible_pos]
-    # filter out cases when the position is occupied by the same color
-    all_directions = [pos for pos in all_directions if board[pos[0]][pos[1]] == None or board[pos[0]][pos[1]].color != piece.color]
-    possible_moves = []
-    for pos in all_directions:
-        assert verify(pos)
-        if board[pos[0]][pos[1]] == None:
-            possible_moves.append((pos, None))
-        else:
-            possible_moves.append((pos, board[pos[0]][pos[1]]))
-    
+def _add_available(piece, destinations, board, possible_moves):
+    # keep the destinations that are empty or occupied by an enemy piece
+    for pos in destinations:
+        target = board[pos[0]][pos[1]]
+        if target is None or target.color != piece.color:
+            possible_moves.append((pos, target))
     return possible_moves
 
+def avail_move_advisor(piece, board):
+    destinations = ADVISOR_MOVES[piece.color]
+    assert piece.position in destinations
+    return _add_available(piece, destinations[piece.position], board, [])
+
 def avail_move_general(piece, board):
-    if piece.color ==  "red":
-        all_possible_pos = [(x,y) for x in range(8,11) for y in range(4,7)]
-    else:
-        all_possible_pos = [(x,y) for x in range(1,4) for y in range(4,7)]
-    assert piece.position in all_possible_pos
-    all_directions =  [(piece.position[0]+1, piece.position[1]), \
-                (piece.position[0]-1, piece.position[1]), \
-                  (piece.position[0], piece.position[1]+1), \
-                    (piece.position[0], piece.position[1]-1)]
-    # filter out cases when going out of the palace
-    all_directions = [pos for pos in all_directions if pos in all_possible_pos]
-    # filter out cases when the position is occupied by the same color
-    all_directions = [pos for pos in all_directions if board[pos[0]][pos[1]] == None \
-                      or board[pos[0]][pos[1]].color != piece.color]
+    destinations = GENERAL_MOVES[piece.color]
+    assert piece.position in destinations
+    possible_moves = _add_available(piece, destinations[piece.position], board, [])
     # IMPORTANT: the general cannot face each other, in the specific case when the generals are facing each other,
     # the general is able to kill the other general
     if piece.color == "red":
@@ -98,7 +129,7 @@ def avail_move_general(piece, board):
         for i in range(piece.position[0]-1,0, -1):
             target = board[i][piece.position[1]]
             if target != None and target.name == "G" and target.color == "black":
-                all_directions.append((i,piece.position[1]))
+                possible_moves.append(((i,piece.position[1]), target))
                 break
             else:
                 break
@@ -106,49 +137,22 @@ def avail_move_general(piece, board):
         for i in range(piece.position[0]+1,11):
             target = board[i][piece.position[1]]
             if target != None and target.name == "G" and target.color == "red":
-                all_directions.append((i,piece.position[1]))
+                possible_moves.append(((i,piece.position[1]), target))
                 break
             else:
                 break
-    possible_moves = []
-    for pos in all_directions:
-        assert verify(pos)
-        if board[pos[0]][pos[1]] == None:
-            possible_moves.append((pos, None))
-        else:
-            possible_moves.append((pos, board[pos[0]][pos[1]]))
     return possible_moves
 
 def avail_move_elephant(piece, board):
-    if piece.color == "red":
-        all_possible_pos = [(10,3),(10,7),(8,1),(8,5),(8,9),(6,3),(6,7)]
-    else:
-        all_possible_pos = [(1,3),(1,7),(3,1),(3,5),(3,9),(5,3),(5,7)]
-    assert piece.position in all_possible_pos
-    # check if the directions are blocked by other pieces
-    all_directions = []
-    if (piece.position[0]+2, piece.position[1]+2) in all_possible_pos and \
-      board[piece.position[0]+1][piece.position[1]+1] == None:
-        all_directions += [(piece.position[0]+2, piece.position[1]+2)]
-    if (piece.position[0]+2, piece.position[1]-2) in all_possible_pos and \
-      board[piece.position[0]+1][piece.position[1]-1] == None:
-        all_directions += [(piece.position[0]+2, piece.position[1]-2)]
-    if (piece.position[0]-2, piece.position[1]+2) in all_possible_pos and \
-      board[piece.position[0]-1][piece.position[1]+1] == None:
-        all_directions += [(piece.position[0]-2, piece.position[1]+2)]
-    if (piece.position[0]-2, piece.position[1]-2) in all_possible_pos and \
-      board[piece.position[0]-1][piece.position[1]-1] == None:  
-        all_directions += [(piece.position[0]-2, piece.position[1]-2)] 
-    # filter out cases when the position is occupied by the same color
-    all_directions = [pos for pos in all_directions if board[pos[0]][pos[1]] == None \
-                      or board[pos[0]][pos[1]].color != piece.color]
+    destinations = ELEPHANT_MOVES[piece.color]
+    assert piece.position in destinations
     possible_moves = []
-    for pos in all_directions:
-        assert verify(pos)
-        if board[pos[0]][pos[1]] == None:
-            possible_moves.append((pos, None))
-        else:
-            possible_moves.append((pos, board[pos[0]][pos[1]]))
+    for pos, eye in destinations[piece.position]:
+        # the move is blocked if the "elephant eye" is occupied
+        if board[eye[0]][eye[1]] is None:
+            target = board[pos[0]][pos[1]]
+            if target is None or target.color != piece.color:
+                possible_moves.append((pos, target))
     return possible_moves
 
 def avail_move_chariot(piece, board):
@@ -274,79 +278,15 @@ def avail_move_cannon(piece, board):
     return possible_moves
 
 def avail_move_horse(piece, board):
-    all_directions = []
-    # check the right direction
-    right_pos = (piece.position[0],piece.position[1]+1)
-    if verify(right_pos) and board[right_pos[0]][right_pos[1]] == None:
-        pos1 = (piece.position[0]+1,piece.position[1] + 2)
-        pos2 = (piece.position[0]-1,piece.position[1] + 2)
-        if verify(pos1) and (board[pos1[0]][pos1[1]] == None or board[pos1[0]][pos1[1]].color != piece.color):
-            all_directions.append(pos1)
-        if verify(pos2) and (board[pos2[0]][pos2[1]] == None or board[pos2[0]][pos2[1]].color != piece.color):
-            all_directions.append(pos2)
-    # check the left direction
-    left_pos = (piece.position[0],piece.position[1]-1)
-    if verify(left_pos) and board[left_pos[0]][left_pos[1]] == None:
-        pos1 = (piece.position[0]+1,piece.position[1] - 2)
-        pos2 = (piece.position[0]-1,piece.position[1] - 2)
-        if verify(pos1) and (board[pos1[0]][pos1[1]] == None or board[pos1[0]][pos1[1]].color != piece.color):
-            all_directions.append(pos1)
-        if verify(pos2) and (board[pos2[0]][pos2[1]] == None or board[pos2[0]][pos2[1]].color != piece.color):
-            all_directions.append(pos2)
-    # check the up direction
-    up_pos = (piece.position[0]-1,piece.position[1])
-    if verify(up_pos) and board[up_pos[0]][up_pos[1]] == None:
-        pos1 = (piece.position[0]-2,piece.position[1] + 1)
-        pos2 = (piece.position[0]-2,piece.position[1] - 1)
-        if verify(pos1) and (board[pos1[0]][pos1[1]] == None or board[pos1[0]][pos1[1]].color != piece.color):
-            all_directions.append(pos1)
-        if verify(pos2) and (board[pos2[0]][pos2[1]] == None or board[pos2[0]][pos2[1]].color != piece.color):
-            all_directions.append(pos2)
-    # check the down direction
-    down_pos = (piece.position[0]+1,piece.position[1])
-    if verify(down_pos) and board[down_pos[0]][down_pos[1]] == None:
-        pos1 = (piece.position[0]+2,piece.position[1] + 1)
-        pos2 = (piece.position[0]+2,piece.position[1] - 1)
-        if verify(pos1) and (board[pos1[0]][pos1[1]] == None or board[pos1[0]][pos1[1]].color != piece.color):
-            all_directions.append(pos1)
-        if verify(pos2) and (board[pos2[0]][pos2[1]] == None or board[pos2[0]][pos2[1]].color != piece.color):
-            all_directions.append(pos2)
     possible_moves = []
-    for pos in all_directions:
-        assert verify(pos)
-        if board[pos[0]][pos[1]] == None:
-            possible_moves.append((pos, None))
-        else:
-            possible_moves.append((pos, board[pos[0]][pos[1]]))
+    for pos, leg in HORSE_MOVES[piece.position]:
+        # the move is blocked if the "horse leg" is occupied
+        if board[leg[0]][leg[1]] is None:
+            target = board[pos[0]][pos[1]]
+            if target is None or target.color != piece.color:
+                possible_moves.append((pos, target))
     return possible_moves
 
 
 def avail_move_soldier(piece, board):
-    if piece.color == "red":
-        # check if this soldier has passed the river
-        if piece.position[0] > 5:
-            all_directions = [(piece.position[0]-1, piece.position[1])]
-        else:
-            all_directions = [(piece.position[0]-1, piece.position[1]), \
-                              (piece.position[0], piece.position[1]+1), \
-                              (piece.position[0], piece.position[1]-1)]
-    else:
-        if piece.position[0] < 6:
-            all_directions = [(piece.position[0]+1, piece.position[1])]
-        else:
-            all_directions = [(piece.position[0]+1, piece.position[1]), \
-                              (piece.position[0], piece.position[1]+1), \
-                              (piece.position[0], piece.position[1]-1)]
-    # filter out cases when the position is occupied by the same color
-    all_directions = [pos for pos in all_directions if pos[0] >= 1 and pos[0] <= 10 and pos[1] >=1 and pos[1]<10 and (board[pos[0]][pos[1]] == None \
-                      or board[pos[0]][pos[1]].color != piece.color)]
-    possible_moves = []
-    for pos in all_directions:
-        if not verify(pos):
-            continue
-        if board[pos[0]][pos[1]] == None:
-            possible_moves.append((pos, None))
-        else:
-            possible_moves.append((pos, board[pos[0]][pos[1]]))
-    return possible_moves
-            
\ No newline at end of file
+    return _add_available(piece, SOLDIER_MOVES[piece.color][piece.position], board, [])
@@ -0,0 +1,130 @@
+# Random playouts for MCTS rollouts.
+#
+# PlayoutEngine runs each playout as a loop on one scratch position that is reused for every playout: moves are
+# played with make_move and all taken back at the end, so a playout allocates no boards or nodes. Instead of
+# generating every move of the side to move, a move is sampled by picking a random piece and then a random move
+# of that piece (trying another piece if it has none), which only generates the moves of one or two pieces per
+# ply. Pieces with few moves are therefore picked a bit more often than with uniform move sampling.
+#
+# With tablebases (see tablebase.py) a playout that reaches a position of a table ends there with the table's
+# result.
+#
+# With piece values (see see.py) the sampling avoids captures that lose material in the exchange that follows:
+# such a capture is only played when the side to move has nothing else.
+#
+# The scratch position is a plain Position by default: a playout generates few moves per ply, so the cheaper
+# make/unmake of Position beats BitboardPosition's faster slider generation here.
+#
+# Rewards use the same convention as MCTSAI: 1 when black wins and -1 when red wins. A playout cut off at
+# max_depth gets the evaluation of its last position (see evaluation.score_to_reward), which the scratch
+# position keeps up to date as moves are played. A side that cannot move loses.
+
+import random
+import time
+
+from position import Position, BLACK, RED, NUM_SQUARES
+from see import is_losing_capture
+from evaluation import score_to_reward
+from tablebase import DRAW, WIN
+
+
+class PlayoutEngine:
+    def __init__(self, seed=None, position_cls=Position, values=None, tablebases=None):
+        self.rng = random.Random(seed)
+        # a TablebaseSet or None
+        self.tablebases = tablebases
+        # piece values by type, used to skip losing captures, or None to sample all moves alike
+        self.values = values
+        self.scratch = position_cls()
+        # reusable buffers for move sampling
+        self.candidates = []
+        self.moves = []
+        # statistics
+        self.playouts = 0
+        self.plies = 0
+        self.elapsed = 0.0
+
+    def load(self, game):
+        # sets the scratch position to the current state of a Board
+        self.scratch.load_board(game)
+
+    def load_position(self, pos):
+        scratch = self.scratch
+        scratch.clear()
+        for side in (RED, BLACK):
+            for sq in pos.pieces[side]:
+                scratch.put_square(sq, pos.squares[sq])
+        scratch.set_turn(pos.turn)
+        scratch.winning = pos.winning
+
+    def random_move(self, pos):
+        # returns a random move of the side to move, or None if it has no move
+        candidates = self.candidates
+        moves = self.moves
+        randrange = self.rng.randrange
+        values = self.values
+        squares = pos.squares
+        candidates[:] = pos.pieces[pos.turn]
+        n = len(candidates)
+        # a losing capture, played if no other move is found
+        fallback = None
+        while n:
+            i = randrange(n)
+            moves.clear()
+            pos.gen_piece_moves(candidates[i], moves)
+            while moves:
+                j = randrange(len(moves))
+                move = moves[j]
+                if values is None or not squares[move % NUM_SQUARES] or not is_losing_capture(pos, move, values):
+                    return move
+                fallback = move
+                moves[j] = moves[-1]
+                moves.pop()
+            # this piece cannot move, remove it from the candidates
+            n -= 1
+            candidates[i] = candidates[n]
+        return fallback
+
+    def run(self, max_depth):
+        # plays one random game of at most max_depth plies from the scratch position and returns its reward
+        start = time.perf_counter()
+        pos = self.scratch
+        base_depth = len(pos.undo_stack)
+        reward = None
+        tablebases = self.tablebases
+        for _ in range(max_depth):
+            if pos.winning is not None:
+                break
+            if tablebases is not None and len(pos.pieces[RED]) + len(pos.pieces[BLACK]) <= tablebases.max_pieces:
+                result = tablebases.probe(pos)
+                if result is not None:
+                    reward = tablebase_reward(pos.turn, result[0])
+                    break
+            move = self.random_move(pos)
+            if move is None:
+                # the side to move cannot move and loses
+                reward = 1 if pos.turn == RED else -1
+                break
+            pos.make_move(move)
+        if pos.winning is not None:
+            reward = 1 if pos.winning == BLACK else -1
+        elif reward is None:
+            # cut off at max_depth
+            reward = score_to_reward(pos.score)
+        self.plies += len(pos.undo_stack) - base_depth
+        while len(pos.undo_stack) > base_depth:
+            pos.unmake_move()
+        self.playouts += 1
+        self.elapsed += time.perf_counter() - start
+        return reward
+
+    def playouts_per_second(self):
+        return self.playouts / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def tablebase_reward(turn, value):
+    # the reward of a tablebase value for the side to move turn
+    if value == DRAW:
+        return 0
+    black_wins = (value == WIN) == (turn == BLACK)
+    return 1 if black_wins else -1
@@ -0,0 +1,421 @@
+# Compact position representation used by the search code.
+#
+# The board is a flat bytearray of 90 squares, square = (row - 1) * 9 + (col - 1) where (row, col)
+# is the 1-based position used by Board/Piece (row 1 is black's back rank, row 10 is red's).
+# Every square holds a small integer piece code: 0 for an empty square, otherwise the piece type
+# (1..7) with the BLACK_FLAG bit set for black pieces. The side to move and the winner are stored as
+# side indices (RED = 0, BLACK = 1) instead of the "red"/"black" strings used by Board.
+
+import random
+
+from evaluation import piece_score
+from pieces import (ADVISOR_MOVES, ADVISOR_POSITIONS, ELEPHANT_MOVES, ELEPHANT_POSITIONS, GENERAL_MOVES,
+                    GENERAL_POSITIONS, HORSE_MOVES, SOLDIER_MOVES)
+
+ROWS, COLS = 10, 9
+NUM_SQUARES = ROWS * COLS
+
+RED, BLACK = 0, 1
+COLORS = ("red", "black")
+SIDE_OF_COLOR = {"red": RED, "black": BLACK}
+
+EMPTY = 0
+GENERAL, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER = 1, 2, 3, 4, 5, 6, 7
+BLACK_FLAG = 8
+TYPE_MASK = 7
+
+# piece type <-> the one letter names used by Piece.name
+PIECE_NAMES = " GAEHRCS"
+TYPE_OF_NAME = {name: t for t, name in enumerate(PIECE_NAMES) if name != " "}
+
+
+def make_code(piece_type, side):
+    return piece_type | (BLACK_FLAG if side == BLACK else 0)
+
+
+def side_of(code):
+    # only meaningful for non-empty squares
+    return code >> 3
+
+
+def type_of(code):
+    return code & TYPE_MASK
+
+
+def code_of_piece(piece):
+    return make_code(TYPE_OF_NAME[piece.name], SIDE_OF_COLOR[piece.color])
+
+
+def square(pos):
+    # (row, col) -> square index
+    return (pos[0] - 1) * COLS + pos[1] - 1
+
+
+def position_of(sq):
+    # square index -> (row, col)
+    return sq // COLS + 1, sq % COLS + 1
+
+
+# Moves are plain ints so that they can be stored and compared cheaply
+def encode_move(frm, to):
+    return frm * NUM_SQUARES + to
+
+
+def decode_move(move):
+    # returns (from_square, to_square)
+    return divmod(move, NUM_SQUARES)
+
+
+# ICCS coordinate notation, as used by xiangqi engines and GUIs: files a-i from left to right and ranks 0-9
+# from red's side, so (10, 1) is "a0" and (1, 9) is "i9". A move is written as from + to, e.g. "h2e2".
+def square_to_iccs(sq):
+    row, col = divmod(sq, COLS)
+    return "abcdefghi"[col] + str(ROWS - 1 - row)
+
+
+def iccs_to_square(text):
+    col = "abcdefghi".index(text[0])
+    return (ROWS - 1 - int(text[1])) * COLS + col
+
+
+def move_to_iccs(move):
+    frm, to = divmod(move, NUM_SQUARES)
+    return square_to_iccs(frm) + square_to_iccs(to)
+
+
+def iccs_to_move(text):
+    if len(text) != 4:
+        raise ValueError(f"Invalid ICCS move {text!r}")
+    return iccs_to_square(text[:2]) * NUM_SQUARES + iccs_to_square(text[2:])
+
+
+# Zobrist keys: a position's key is the xor of ZOBRIST[code][square] over all pieces, xor ZOBRIST_SIDE when
+# black is to move. Keys are updated incrementally when a move is played, and can be used as dict keys.
+# The generator is seeded so that keys are the same in every process and can be stored on disk.
+_zobrist_rng = random.Random(4701)
+ZOBRIST = [[0] * NUM_SQUARES] + [[_zobrist_rng.getrandbits(64) for _ in range(NUM_SQUARES)] for _ in range(1, 16)]
+ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+
+
+# Palace and river restrictions, indexed by side
+ADVISOR_SQUARES = tuple(frozenset(square(p) for p in ADVISOR_POSITIONS[color]) for color in COLORS)
+GENERAL_SQUARES = tuple(frozenset(square(p) for p in GENERAL_POSITIONS[color]) for color in COLORS)
+ELEPHANT_SQUARES = tuple(frozenset(square(p) for p in ELEPHANT_POSITIONS[color]) for color in COLORS)
+
+
+# Square indexed versions of the move tables in pieces.py. Entries are (to, move) for the step moves and
+# (to, blocking square, move) for the horse and the elephant, where move is the encoded move from the square.
+def _step_table(tables):
+    table = [()] * NUM_SQUARES
+    for pos, destinations in tables.items():
+        sq = square(pos)
+        table[sq] = tuple((square(to), encode_move(sq, square(to))) for to in destinations)
+    return tuple(table)
+
+
+def _blocked_table(tables):
+    table = [()] * NUM_SQUARES
+    for pos, destinations in tables.items():
+        sq = square(pos)
+        table[sq] = tuple((square(to), square(block), encode_move(sq, square(to))) for to, block in destinations)
+    return tuple(table)
+
+
+HORSE_TABLE = _blocked_table(HORSE_MOVES)
+ELEPHANT_TABLE = tuple(_blocked_table(ELEPHANT_MOVES[color]) for color in COLORS)
+ADVISOR_TABLE = tuple(_step_table(ADVISOR_MOVES[color]) for color in COLORS)
+GENERAL_TABLE = tuple(_step_table(GENERAL_MOVES[color]) for color in COLORS)
+SOLDIER_TABLE = tuple(_step_table(SOLDIER_MOVES[color]) for color in COLORS)
+
+
+def _soldier_squares(side):
+    # the squares a soldier can reach from its starting squares
+    row = 6 if side == RED else 3
+    squares = {row * COLS + col for col in range(0, COLS, 2)}
+    frontier = list(squares)
+    while frontier:
+        sq = frontier.pop()
+        for to, move in SOLDIER_TABLE[side][sq]:
+            if to not in squares:
+                squares.add(to)
+                frontier.append(to)
+    return frozenset(squares)
+
+
+SOLDIER_SQUARES = (_soldier_squares(RED), _soldier_squares(BLACK))
+
+ORTHOGONAL = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+# back rank from column 1 to 9
+BACK_RANK = (CHARIOT, HORSE, ELEPHANT, ADVISOR, GENERAL, ADVISOR, ELEPHANT, HORSE, CHARIOT)
+
+
+def on_board(row, col):
+    # 0-based row and column
+    return 0 <= row < ROWS and 0 <= col < COLS
+
+
+EMPTY_SQUARES = bytes(NUM_SQUARES)
+
+# SCORE[code][sq] is the evaluation of the piece with code on square sq (0 for an empty square), see
+# evaluation.py. Position.score is the sum over the pieces, kept up to date by put_square and make_move
+SCORE = [[piece_score(PIECE_NAMES[type_of(code)], COLORS[side_of(code)], position_of(sq)) if type_of(code) else 0
+          for sq in range(NUM_SQUARES)]
+         for code in range(16)]
+
+
+class Position:
+    def __init__(self):
+        self.squares = bytearray(NUM_SQUARES)
+        # piece lists: the occupied squares of each side
+        self.pieces = [set(), set()]
+        self.turn = RED
+        self.winning = None
+        self.key = 0
+        # evaluation from red's point of view, see SCORE
+        self.score = 0
+        # (move, captured code, previous winner, previous key, previous score) for every move played with
+        # make_move
+        self.undo_stack = []
+
+    @classmethod
+    def start(cls):
+        pos = cls()
+        for col in range(1, COLS + 1):
+            pos.put((1, col), make_code(BACK_RANK[col - 1], BLACK))
+            pos.put((10, col), make_code(BACK_RANK[col - 1], RED))
+        for col in (2, 8):
+            pos.put((3, col), make_code(CANNON, BLACK))
+            pos.put((8, col), make_code(CANNON, RED))
+        for col in (1, 3, 5, 7, 9):
+            pos.put((4, col), make_code(SOLDIER, BLACK))
+            pos.put((7, col), make_code(SOLDIER, RED))
+        return pos
+
+    @classmethod
+    def from_board(cls, board):
+        # board is a Board object (or anything with pieces, turn and winning)
+        pos = cls()
+        pos.load_board(board)
+        return pos
+
+    def load_board(self, board):
+        # same as from_board, but reuses this position instead of creating a new one
+        self.clear()
+        for piece in board.pieces:
+            self.put(piece.position, code_of_piece(piece))
+        self.set_turn(SIDE_OF_COLOR[board.turn])
+        self.winning = None if board.winning is None else SIDE_OF_COLOR[board.winning]
+
+    def clear(self):
+        # removes every piece, in place
+        self.squares[:] = EMPTY_SQUARES
+        self.pieces[RED].clear()
+        self.pieces[BLACK].clear()
+        self.turn = RED
+        self.winning = None
+        self.key = 0
+        self.score = 0
+        self.undo_stack.clear()
+
+    def put(self, pos, code):
+        # puts a piece on an empty (row, col) position
+        self.put_square(square(pos), code)
+
+    def put_square(self, sq, code):
+        assert self.squares[sq] == EMPTY
+        self.squares[sq] = code
+        self.pieces[side_of(code)].add(sq)
+        self.key ^= ZOBRIST[code][sq]
+        self.score += SCORE[code][sq]
+
+    def set_turn(self, side):
+        if side != self.turn:
+            self.turn = side
+            self.key ^= ZOBRIST_SIDE
+
+    def compute_key(self):
+        # Full recomputation of the Zobrist key, self.key is kept up to date incrementally
+        key = ZOBRIST_SIDE if self.turn == BLACK else 0
+        for sq, code in enumerate(self.squares):
+            key ^= ZOBRIST[code][sq]
+        return key
+
+    def copy(self):
+        pos = self.__class__.__new__(self.__class__)
+        pos.squares = bytearray(self.squares)
+        pos.pieces = [set(self.pieces[RED]), set(self.pieces[BLACK])]
+        pos.turn = self.turn
+        pos.winning = self.winning
+        pos.key = self.key
+        pos.score = self.score
+        pos.undo_stack = []
+        return pos
+
+    def to_pieces(self, piece_cls):
+        # Convert back to the Piece model. piece_cls is the Piece class the caller works with
+        pieces = []
+        for side in (BLACK, RED):
+            for sq in sorted(self.pieces[side]):
+                code = self.squares[sq]
+                pieces.append(piece_cls(PIECE_NAMES[type_of(code)], COLORS[side], position_of(sq)))
+        return pieces
+
+    def to_board(self):
+        # rules.py imports this module, so import it here
+        from rules import Board, Piece
+        board = Board()
+        for x in range(ROWS + 1):
+            for y in range(COLS + 1):
+                board.board[x][y] = None
+        board.custom_init(self.to_pieces(Piece), [], COLORS[self.turn], None)
+        if self.winning is not None:
+            board.winning = COLORS[self.winning]
+        return board
+
+    def gen_moves(self, side=None):
+        # All moves of one side (the side to move by default), following the same rules as pieces.avail_move.
+        # Returns a list of encoded moves, see encode_move
+        if side is None:
+            side = self.turn
+        squares = self.squares
+        moves = []
+        for sq in self.pieces[side]:
+            GENERATORS[squares[sq] & TYPE_MASK](squares, sq, side, moves)
+        return moves
+
+    def gen_piece_moves(self, sq, out):
+        # appends the moves of the piece on square sq to out
+        code = self.squares[sq]
+        GENERATORS[code & TYPE_MASK](self.squares, sq, code >> 3, out)
+
+    def make_move(self, move):
+        # Play an encoded move in place and switch the turn, see unmake_move
+        frm, to = divmod(move, NUM_SQUARES)
+        squares = self.squares
+        side = self.turn
+        code = squares[frm]
+        captured = squares[to]
+        self.undo_stack.append((move, captured, self.winning, self.key, self.score))
+        squares[to] = code
+        squares[frm] = EMPTY
+        self.key ^= ZOBRIST[code][frm] ^ ZOBRIST[code][to] ^ ZOBRIST[captured][to] ^ ZOBRIST_SIDE
+        self.score += SCORE[code][to] - SCORE[code][frm] - SCORE[captured][to]
+        own = self.pieces[side]
+        own.remove(frm)
+        own.add(to)
+        if captured != EMPTY:
+            self.pieces[side ^ 1].remove(to)
+            if captured & TYPE_MASK == GENERAL:
+                self.winning = side
+        self.turn = side ^ 1
+
+    def unmake_move(self):
+        move, captured, winning, self.key, self.score = self.undo_stack.pop()
+        frm, to = divmod(move, NUM_SQUARES)
+        squares = self.squares
+        side = self.turn ^ 1
+        squares[frm] = squares[to]
+        squares[to] = captured
+        own = self.pieces[side]
+        own.remove(to)
+        own.add(frm)
+        if captured != EMPTY:
+            self.pieces[side ^ 1].add(to)
+        self.winning = winning
+        self.turn = side
+
+    def __repr__(self):
+        rows = []
+        for row in range(ROWS):
+            line = ""
+            for col in range(COLS):
+                code = self.squares[row * COLS + col]
+                if code == EMPTY:
+                    line += "."
+                elif side_of(code) == RED:
+                    line += PIECE_NAMES[type_of(code)]
+                else:
+                    line += PIECE_NAMES[type_of(code)].lower()
+            rows.append(line)
+        return f"Position({COLORS[self.turn]} to move)\n" + "\n".join(rows)
+
+
+# Move generators, one per piece type. Each appends encoded moves from square sq to out.
+# A destination is available when it is empty or holds an enemy piece.
+
+def _gen_steps(table, squares, side, out):
+    for to, move in table:
+        target = squares[to]
+        if target == EMPTY or target >> 3 != side:
+            out.append(move)
+
+
+def _gen_blocked(table, squares, side, out):
+    for to, block, move in table:
+        if squares[block] == EMPTY:
+            target = squares[to]
+            if target == EMPTY or target >> 3 != side:
+                out.append(move)
+
+
+def gen_advisor(squares, sq, side, out):
+    _gen_steps(ADVISOR_TABLE[side][sq], squares, side, out)
+
+
+def gen_general(squares, sq, side, out):
+    # The generals can never face each other from inside their palaces without another piece in between
+    # being adjacent, so pieces.avail_move_general's special case never adds a move here
+    _gen_steps(GENERAL_TABLE[side][sq], squares, side, out)
+
+
+def gen_elephant(squares, sq, side, out):
+    # blocked when the "elephant eye" is occupied
+    _gen_blocked(ELEPHANT_TABLE[side][sq], squares, side, out)
+
+
+def gen_horse(squares, sq, side, out):
+    # blocked when the "horse leg" is occupied
+    _gen_blocked(HORSE_TABLE[sq], squares, side, out)
+
+
+def gen_chariot(squares, sq, side, out):
+    row, col = divmod(sq, COLS)
+    for dr, dc in ORTHOGONAL:
+        r, c = row + dr, col + dc
+        while on_board(r, c):
+            to = r * COLS + c
+            target = squares[to]
+            if target == EMPTY:
+                out.append(sq * NUM_SQUARES + to)
+            else:
+                if target >> 3 != side:
+                    out.append(sq * NUM_SQUARES + to)
+                break
+            r, c = r + dr, c + dc
+
+
+def gen_cannon(squares, sq, side, out):
+    row, col = divmod(sq, COLS)
+    for dr, dc in ORTHOGONAL:
+        r, c = row + dr, col + dc
+        # slide until the first piece (the screen)
+        while on_board(r, c) and squares[r * COLS + c] == EMPTY:
+            out.append(sq * NUM_SQUARES + r * COLS + c)
+            r, c = r + dr, c + dc
+        r, c = r + dr, c + dc
+        # then jump over it to capture the next piece if it is an enemy
+        while on_board(r, c):
+            target = squares[r * COLS + c]
+            if target != EMPTY:
+                if target >> 3 != side:
+                    out.append(sq * NUM_SQUARES + r * COLS + c)
+                break
+            r, c = r + dr, c + dc
+
+
+def gen_soldier(squares, sq, side, out):
+    _gen_steps(SOLDIER_TABLE[side][sq], squares, side, out)
+
+
+GENERATORS = (None, gen_general, gen_advisor, gen_elephant, gen_horse, gen_chariot, gen_cannon, gen_soldier)
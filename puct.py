@@ -0,0 +1,283 @@
+# PUCT search with batched leaf evaluation.
+#
+# Instead of random rollouts, the leaves of the tree are scored by an evaluator that returns, for a batch of
+# positions, the prior probabilities of their moves and their values. A move is selected with the PUCT rule of
+# AlphaZero: the mean value of the move plus c_puct * prior * sqrt(parent visits) / (1 + move visits).
+#
+# The search walks down the tree batch_size times before calling the evaluator: each walk stops at a leaf that
+# has not been evaluated yet and queues it. A virtual loss is added to the moves on the way down, so that the
+# next walks see them as lost and take other paths. Once the batch is full (or a walk runs into a leaf that is
+# already queued), the queued leaves are evaluated in one call, expanded, and their values replace the virtual
+# losses on their paths. Finished games are scored directly and never reach the evaluator.
+#
+# An evaluator is any object with an evaluate(positions) method taking a list of Position objects and returning
+# (priors, values): priors an (N, features.POLICY_SIZE) array of move probabilities (see features.policy_index,
+# the search keeps those of the moves that can be played and normalizes them) and values an (N,) array of
+# values between -1 and 1 from the point of view of the side to move. Two are included:
+#   MLPEvaluator       a NumPy multilayer perceptron over the feature planes of features.py, with weights loaded
+#                      from a .npz file (see MLPEvaluator.save), or random ones
+#   MaterialEvaluator  uniform priors and the static evaluation of evaluation.py, which needs no weights
+#
+# Values in the tree are stored from the point of view of the side that made the move leading to a node, so a
+# node picks the child with the highest mean value for its side to move, and the value of a leaf changes sign at
+# every level on the way back up.
+
+import math
+import time
+
+import numpy as np
+
+from evaluation import REWARD_SCALE
+from features import PLANES, POLICY_INDEX, POLICY_SIZE, encode_positions
+from position import NUM_SQUARES, RED
+
+
+class PUCTNode:
+    __slots__ = ("moves", "priors", "children", "n", "w", "pending")
+
+    def __init__(self):
+        # encoded moves and their priors, set when the node is expanded
+        self.moves = None
+        self.priors = None
+        # child nodes by index in moves, None for the moves not played yet
+        self.children = None
+        # visits and total value from the point of view of the side that moved into this node, virtual losses
+        # included
+        self.n = 0
+        self.w = 0.0
+        # queued for evaluation
+        self.pending = False
+
+
+class PUCTSearch:
+    def __init__(self, evaluator, c_puct=1.5, batch_size=16, virtual_loss=1):
+        self.evaluator = evaluator
+        self.c_puct = c_puct
+        # number of leaves evaluated together
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+        self.stopped = False
+        # statistics of the last search
+        self.evaluations = 0
+        self.batches = 0
+        self.elapsed = 0.0
+
+    def select_child(self, node):
+        # index of the move of node with the highest PUCT score
+        c = self.c_puct * math.sqrt(node.n + 1)
+        best_score = -float("inf")
+        best = 0
+        children = node.children
+        for i, prior in enumerate(node.priors):
+            child = children[i]
+            if child is None or child.n == 0:
+                score = c * prior
+            else:
+                score = child.w / child.n + c * prior / (1 + child.n)
+            if score > best_score:
+                best_score = score
+                best = i
+        return best
+
+    def descend(self, root, pos):
+        # Walks down from root, playing the selected moves on pos and adding a virtual loss to the nodes on the
+        # way, until it reaches a node that is not expanded. Returns the nodes on the path
+        path = [root]
+        node = root
+        vl = self.virtual_loss
+        while node.moves is not None and node.moves and pos.winning is None:
+            i = self.select_child(node)
+            child = node.children[i]
+            if child is None:
+                child = node.children[i] = PUCTNode()
+            pos.make_move(node.moves[i])
+            child.n += vl
+            child.w -= vl
+            path.append(child)
+            node = child
+        return path
+
+    def backup(self, path, value):
+        # Adds the value of the last node of path, from the point of view of its side to move, to the nodes of
+        # path and takes back the virtual losses of descend
+        vl = self.virtual_loss
+        # the last node was entered by the opponent of its side to move
+        value = -value
+        for node in reversed(path[1:]):
+            node.n += 1 - vl
+            node.w += value + vl
+            value = -value
+        path[0].n += 1
+
+    def revert(self, path):
+        # takes back the virtual losses of descend without adding a value
+        vl = self.virtual_loss
+        for node in path[1:]:
+            node.n -= vl
+            node.w += vl
+
+    def expand(self, node, moves, priors):
+        legal = priors[POLICY_INDEX[moves]]
+        total = legal.sum()
+        if total > 0:
+            legal = legal / total
+        else:
+            legal = np.full(len(moves), 1 / len(moves))
+        node.moves = moves
+        node.priors = legal.tolist()
+        node.children = [None] * len(moves)
+
+    def run(self, root, pos, time_ms=None, max_nodes=800):
+        # Searches pos (a Position, restored when the search returns) from root until time_ms milliseconds have
+        # passed or max_nodes leaves have been evaluated, and returns root
+        start = time.perf_counter()
+        deadline = None if time_ms is None else start + time_ms / 1000
+        base_depth = len(pos.undo_stack)
+        self.evaluations = 0
+        self.batches = 0
+        self.stopped = False
+        nodes = 0
+        while True:
+            queue = []
+            for _ in range(self.batch_size):
+                path = self.descend(root, pos)
+                leaf = path[-1]
+                collision = False
+                if pos.winning is not None:
+                    # the side to move lost its general
+                    self.backup(path, -1)
+                    nodes += 1
+                elif leaf.pending:
+                    # the virtual losses did not steer this walk away from a queued leaf, evaluate the batch
+                    self.revert(path)
+                    collision = True
+                else:
+                    moves = pos.gen_moves()
+                    if not moves:
+                        # the side to move cannot move and loses
+                        leaf.moves = moves
+                        self.backup(path, -1)
+                        nodes += 1
+                    else:
+                        leaf.pending = True
+                        queue.append((path, moves, pos.copy()))
+                while len(pos.undo_stack) > base_depth:
+                    pos.unmake_move()
+                if collision:
+                    break
+            if queue:
+                priors, values = self.evaluator.evaluate([entry[2] for entry in queue])
+                self.evaluations += len(queue)
+                self.batches += 1
+                for (path, moves, leaf_pos), leaf_priors, value in zip(queue, priors, values):
+                    leaf = path[-1]
+                    leaf.pending = False
+                    self.expand(leaf, moves, leaf_priors)
+                    self.backup(path, float(value))
+                nodes += len(queue)
+
+            if self.stopped or max_nodes is not None and nodes >= max_nodes:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if self.forced(root):
+                break
+        self.elapsed = time.perf_counter() - start
+        return root
+
+    def forced(self, root):
+        # True when there is nothing to choose from: the root has no move, or a single one that has been visited
+        # (so that root_stats gives it)
+        if root.moves is None or len(root.moves) > 1:
+            return False
+        return not root.moves or root.children[0] is not None and root.children[0].n > 0
+
+    def best_move(self, root):
+        # the most visited move of root, or the one with the highest prior when the budget ran out before any
+        # move was visited. None when the root has no move
+        stats = self.root_stats(root)
+        if stats:
+            return max(stats, key=lambda move: stats[move][0])
+        if root.moves:
+            return root.moves[max(range(len(root.moves)), key=lambda i: root.priors[i])]
+        return None
+
+    def stop(self):
+        # can be called from another thread to end the search after the current batch
+        self.stopped = True
+
+    def root_stats(self, root):
+        # {encoded move: (visits, mean value for the side to move at the root)} of the moves searched
+        stats = dict()
+        for move, child in zip(root.moves or (), root.children or ()):
+            if child is not None and child.n > 0:
+                stats[move] = (child.n, child.w / child.n)
+        return stats
+
+
+class MaterialEvaluator:
+    # uniform priors and the static evaluation of the position, for a search that needs no weights
+    def evaluate(self, positions):
+        priors = np.ones((len(positions), POLICY_SIZE), dtype=np.float32)
+        scores = np.array([pos.score for pos in positions], dtype=np.float64)
+        turns = np.array([pos.turn for pos in positions])
+        # the score is from red's point of view
+        values = np.tanh(scores / REWARD_SCALE) * np.where(turns == RED, 1, -1)
+        return priors, values
+
+
+class MLPEvaluator:
+    # A multilayer perceptron: the feature planes of features.py and the side to move go through hidden layers
+    # with ReLU activations into a policy head (softmax over the POLICY_SIZE moves) and a value head (tanh).
+    # Weights are loaded from a .npz file written by save, or initialised at random (hidden gives the layer
+    # sizes then), which makes a search with uniform-ish priors and noisy values
+    def __init__(self, path=None, hidden=(256,), seed=0):
+        if path is not None:
+            self.load(path)
+            return
+        rng = np.random.default_rng(seed)
+        sizes = [PLANES * NUM_SQUARES + 1] + list(hidden)
+        self.layers = []
+        for fan_in, fan_out in zip(sizes, sizes[1:]):
+            self.layers.append((rng.normal(0, math.sqrt(2 / fan_in), (fan_in, fan_out)).astype(np.float32),
+                                np.zeros(fan_out, dtype=np.float32)))
+        self.policy = (rng.normal(0, 0.01, (sizes[-1], POLICY_SIZE)).astype(np.float32),
+                       np.zeros(POLICY_SIZE, dtype=np.float32))
+        self.value = (rng.normal(0, 0.01, (sizes[-1], 1)).astype(np.float32), np.zeros(1, dtype=np.float32))
+
+    def save(self, path):
+        arrays = {"policy_w": self.policy[0], "policy_b": self.policy[1],
+                  "value_w": self.value[0], "value_b": self.value[1]}
+        for i, (weights, bias) in enumerate(self.layers):
+            arrays[f"hidden{i}_w"] = weights
+            arrays[f"hidden{i}_b"] = bias
+        np.savez(path, **arrays)
+
+    def load(self, path):
+        with np.load(path) as data:
+            self.policy = (data["policy_w"], data["policy_b"])
+            self.value = (data["value_w"], data["value_b"])
+            self.layers = []
+            while f"hidden{len(self.layers)}_w" in data:
+                i = len(self.layers)
+                self.layers.append((data[f"hidden{i}_w"], data[f"hidden{i}_b"]))
+
+    def forward(self, inputs):
+        # inputs: (N, PLANES * NUM_SQUARES + 1) -> (policy probabilities, values)
+        x = inputs
+        for weights, bias in self.layers:
+            x = np.maximum(x @ weights + bias, 0)
+        logits = x @ self.policy[0] + self.policy[1]
+        logits -= logits.max(axis=1, keepdims=True)
+        priors = np.exp(logits)
+        priors /= priors.sum(axis=1, keepdims=True)
+        values = np.tanh(x @ self.value[0] + self.value[1])[:, 0]
+        return priors, values
+
+    def evaluate(self, positions):
+        n = len(positions)
+        inputs = np.empty((n, PLANES * NUM_SQUARES + 1), dtype=np.float32)
+        planes, turns = encode_positions(positions)
+        inputs[:, :-1] = planes.reshape(n, -1)
+        inputs[:, -1] = turns
+        return self.forward(inputs)
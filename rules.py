@@ -0,0 +1,179 @@
+# In coding positions, we will use the standard notation/abbreviations from Wiki:
+# A = 仕/士 (Advisor)
+# C = 砲/炮 (Cannon)
+# R = 俥/車 (Chariot)
+# E = 相/象 (Elephant)
+# G = 帥/將 (General)
+# H = 傌/馬 (Horse)
+# S = 兵/卒 (Soldier)
+
+# This module holds the game state and rules only, without any pygame dependency, so that the search
+# (mcts.py) and batch jobs can use it on machines without a display. board.py draws it with pygame.
+
+from pieces import avail_move
+from position import SCORE, ZOBRIST, ZOBRIST_SIDE, code_of_piece, square
+
+ROWS, COLS = 10, 9
+
+# Game States
+SHOWING_POSSIBLE_MOVES = 0
+WAITING_FOR_MOVE = 1
+AI_MOVING = 2
+
+
+class Piece:
+    def __init__(self, name, color, position):
+        self.name = name
+        self.color = color
+        self.position = position
+        self.selected_piece = None
+        self.selected_avail_moves = []
+
+class Board:
+    def __init__(self):
+        # Initialize the board with all open positions as None, for positions with 0, they are open and would not be used
+        # IMPORTANT: board[i][j] denotes the piece at the ith row and jth column
+        # IMPORTANT: board[i][j] denotes the piece at the ith row and jth column
+        # IMPORTANT: board[i][j] denotes the piece at the ith row and jth column
+        # the board would be used for calculations
+        self.board = [[None for _ in range(COLS + 1)] for _ in range(ROWS + 1)]
+        # initialize all the pieces at the start of the game as alive at their starting positions
+        self.init_piece()
+        self.dead_pieces = []
+        self.put_piece()
+        self.game_state = WAITING_FOR_MOVE
+        self.turn = "red"
+        self.winning = None
+        # undo records of the moves played with make_move
+        self.undo_stack = []
+        # Zobrist key of the position, kept up to date by execute_move and _switch_turn, see position.py
+        self.key = self.compute_key()
+        # evaluation from red's point of view, kept up to date by execute_move, see evaluation.py
+        self.score = self.compute_score()
+
+    def set_bot(self, bot):
+        self.bot = bot
+
+    def custom_init(self,pieces,dead_pieces,turn,bot):
+        self.pieces = pieces
+        self.dead_pieces = dead_pieces
+        self.put_piece()
+        self.game_state = WAITING_FOR_MOVE
+        self.turn = turn
+        self.winning = None
+        self.bot = bot
+        self.undo_stack = []
+        self.key = self.compute_key()
+        self.score = self.compute_score()
+
+    def _switch_turn(self):
+        if self.turn == "red":
+            self.turn = "black"
+        else:
+            self.turn = "red"
+        self.key ^= ZOBRIST_SIDE
+
+    def compute_key(self):
+        key = ZOBRIST_SIDE if self.turn == "black" else 0
+        for piece in self.pieces:
+            key ^= ZOBRIST[code_of_piece(piece)][square(piece.position)]
+        return key
+
+    def compute_score(self):
+        # full recomputation of the evaluation, only needed when the pieces are set up
+        return sum(SCORE[code_of_piece(piece)][square(piece.position)] for piece in self.pieces)
+
+    def init_piece(self):
+        pieces = [
+                     Piece("R", "black", (1, 1)),
+                     Piece("H", "black", (1, 2)),
+                     Piece("E", "black", (1, 3)),
+                     Piece("A", "black", (1, 4)),
+                     Piece("G", "black", (1, 5)),
+                     Piece("A", "black", (1, 6)),
+                     Piece("E", "black", (1, 7)),
+                     Piece("H", "black", (1, 8)),
+                     Piece("R", "black", (1, 9)),
+                     Piece("C", "black", (3, 2)),
+                     Piece("C", "black", (3, 8)),
+                     Piece("S", "black", (4, 1)),
+                     Piece("S", "black", (4, 3)),
+                     Piece("S", "black", (4, 5)),
+                     Piece("S", "black", (4, 7)),
+                     Piece("S", "black", (4, 9)),
+                 ] + [
+                     Piece("R", "red", (10, 1)),
+                     Piece("H", "red", (10, 2)),
+                     Piece("E", "red", (10, 3)),
+                     Piece("A", "red", (10, 4)),
+                     Piece("G", "red", (10, 5)),
+                     Piece("A", "red", (10, 6)),
+                     Piece("E", "red", (10, 7)),
+                     Piece("H", "red", (10, 8)),
+                     Piece("R", "red", (10, 9)),
+                     Piece("C", "red", (8, 2)),
+                     Piece("C", "red", (8, 8)),
+                     Piece("S", "red", (7, 1)),
+                     Piece("S", "red", (7, 3)),
+                     Piece("S", "red", (7, 5)),
+                     Piece("S", "red", (7, 7)),
+                     Piece("S", "red", (7, 9)),
+                 ]
+        self.pieces = pieces
+
+    def put_piece(self):
+        # put the pieces on the board
+        for piece in self.pieces:
+            x, y = piece.position
+            self.board[x][y] = piece
+
+    def execute_move(self,piece,move):
+        if piece is not None and move is not None:
+            code = code_of_piece(piece)
+            self.key ^= ZOBRIST[code][square(piece.position)] ^ ZOBRIST[code][square(move[0])]
+            self.score += SCORE[code][square(move[0])] - SCORE[code][square(piece.position)]
+            # move the piece to the new position
+            self.board[piece.position[0]][piece.position[1]] = None
+            piece.position = move[0]
+            self.board[move[0][0]][move[0][1]] = piece
+            # check if any enemy piece is killed
+            if move[1] is not None:
+                self.key ^= ZOBRIST[code_of_piece(move[1])][square(move[0])]
+                self.score -= SCORE[code_of_piece(move[1])][square(move[0])]
+                self.dead_pieces.append(move[1])
+                self.pieces.remove(move[1])
+                # check if the game is over
+                if move[1].name == "G":
+                    self.winning = self.turn
+            # print("AI moved")
+        else:
+            pass
+            # print("AI cannot move")
+
+    def make_move(self, piece, move):
+        # Play a move in place and switch the turn, keeping an undo record so that unmake_move can take it back.
+        # Used by the search to walk the game tree without copying the board
+        self.undo_stack.append((piece, piece.position, move[1], self.winning, self.turn, self.key, self.score))
+        self.execute_move(piece, move)
+        self._switch_turn()
+
+    def unmake_move(self):
+        piece, old_position, captured, winning, turn, key, score = self.undo_stack.pop()
+        # the captured piece (or None) goes back to the square the piece moved to
+        self.board[piece.position[0]][piece.position[1]] = captured
+        piece.position = old_position
+        self.board[old_position[0]][old_position[1]] = piece
+        if captured is not None:
+            self.dead_pieces.pop()
+            self.pieces.append(captured)
+        self.winning = winning
+        self.turn = turn
+        self.key = key
+        self.score = score
+
+    def cannot_move(self):
+        total_moves = []
+        for piece in self.pieces:
+            if piece.color == self.turn:
+                total_moves += avail_move(piece, self.board)
+        return len(total_moves) == 0
@@ -0,0 +1,61 @@
+# Statistics of one MCTS search, collected when MCTSAI is created with search_stats=True.
+#
+# MCTSAI.search fills a SearchStats as it runs: the counters are updated once per iteration and the phases
+# (selection, expansion, rollout, backpropagation) are timed with perf_counter around each of them. Without
+# search_stats the search only tests that the stats object is None, so collecting nothing costs nothing.
+# The result is MCTSAI.stats after the search, and to_dict/to_json export it, e.g. for selfplay.py --stats.
+
+import json
+
+PHASES = ("selection", "expansion", "rollout", "backprop")
+
+
+class SearchStats:
+    def __init__(self):
+        self.iterations = 0
+        # nodes added to the tree
+        self.nodes_expanded = 0
+        self.rollouts = 0
+        # plies played by the rollouts
+        self.plies = 0
+        # depth of the node each iteration ended on, the root being depth 0
+        self.max_depth = 0
+        self.total_depth = 0
+        # largest number of nodes in the transposition table
+        self.peak_nodes = 0
+        # visits of the root kept from the previous search (see MCTSAI.reused_tree)
+        self.reused_visits = 0
+        # seconds spent in each phase, and in the whole search
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.elapsed = 0.0
+        # {ICCS move: visits} of the root's children
+        self.root_visits = dict()
+
+    def add_iteration(self, depth, expanded, rollouts, plies, nodes):
+        self.iterations += 1
+        self.nodes_expanded += expanded
+        self.rollouts += rollouts
+        self.plies += plies
+        self.total_depth += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if nodes > self.peak_nodes:
+            self.peak_nodes = nodes
+
+    def to_dict(self):
+        elapsed = self.elapsed
+        rollout_time = self.times["rollout"]
+        return {"iterations": self.iterations, "nodes_expanded": self.nodes_expanded, "rollouts": self.rollouts,
+                "plies": self.plies,
+                "nodes_per_second": self.nodes_expanded / elapsed if elapsed > 0 else 0.0,
+                "playouts_per_second": self.rollouts / rollout_time if rollout_time > 0 else 0.0,
+                "max_depth": self.max_depth,
+                "average_depth": self.total_depth / self.iterations if self.iterations else 0.0,
+                "peak_nodes": self.peak_nodes, "reused_visits": self.reused_visits, "elapsed": elapsed,
+                "times": dict(self.times), "root_visits": dict(self.root_visits)}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def __repr__(self):
+        return f"SearchStats({self.to_json()})"
@@ -0,0 +1,72 @@
+# Static exchange evaluation (SEE).
+#
+# see(pos, move, values) tells what a capture wins once the whole exchange on the destination square is played
+# out: after the capture the opponent recaptures with its least valuable piece that can reach the square, then
+# the first side recaptures in the same way, and so on, each side being free to stop when going on would lose
+# material. Attackers are found with the move generators of Position, and the captures are really played on
+# pos (and taken back), so pieces uncovered by a capture (a chariot behind another one, a cannon that gets a
+# new screen) join the exchange as they would in the game.
+#
+# values is a list of piece values indexed by piece type, see piece_values.
+
+from position import NUM_SQUARES, PIECE_NAMES, TYPE_MASK
+
+
+def piece_values(piece_value):
+    # converts a {piece name: value} dict such as MCTSAI.piece_value to a list indexed by piece type
+    return [0] + [piece_value[name] for name in PIECE_NAMES[1:]]
+
+
+def least_valuable_attacker(pos, sq, side, values):
+    # returns the square of the least valuable piece of side that can move to sq, or None
+    squares = pos.squares
+    best_sq = None
+    best_value = None
+    moves = []
+    for frm in pos.pieces[side]:
+        value = values[squares[frm] & TYPE_MASK]
+        if best_value is not None and value >= best_value:
+            continue
+        moves.clear()
+        pos.gen_piece_moves(frm, moves)
+        if frm * NUM_SQUARES + sq in moves:
+            best_sq = frm
+            best_value = value
+    return best_sq
+
+
+def see(pos, move, values):
+    # Returns the material the side to move gains with move once the exchange on its destination is over
+    # (0 for a quiet move that cannot be taken, negative for a losing capture). pos is left unchanged
+    frm, to = divmod(move, NUM_SQUARES)
+    squares = pos.squares
+    # gains[i] is the gain of the side making the i-th capture if the exchange stopped after it
+    gains = [values[squares[to] & TYPE_MASK]]
+    on_square = values[squares[frm] & TYPE_MASK]
+    pos.make_move(move)
+    played = 1
+    while pos.winning is None:
+        attacker = least_valuable_attacker(pos, to, pos.turn, values)
+        if attacker is None:
+            break
+        gains.append(on_square - gains[-1])
+        on_square = values[squares[attacker] & TYPE_MASK]
+        pos.make_move(attacker * NUM_SQUARES + to)
+        played += 1
+    for _ in range(played):
+        pos.unmake_move()
+    # every side only makes its capture when that is better than stopping before it
+    while len(gains) > 1:
+        gain = gains.pop()
+        gains[-1] = -max(-gains[-1], gain)
+    return gains[0]
+
+
+def is_losing_capture(pos, move, values):
+    # True when move loses material in the exchange it starts. Taking a piece at least as valuable as the
+    # capturing one never loses, so the exchange is only played out for the other captures
+    frm, to = divmod(move, NUM_SQUARES)
+    squares = pos.squares
+    if values[squares[to] & TYPE_MASK] >= values[squares[frm] & TYPE_MASK]:
+        return False
+    return see(pos, move, values) < 0
@@ -0,0 +1,205 @@
+# Headless self-play.
+#
+# Plays engine against engine games in a process pool and writes every game as soon as it is finished, as one
+# JSON line: {"game": number, "red": engine, "black": engine, "seed": seed, "moves": [ICCS moves],
+# "stats": [per move search summary, see MCTSAI.last_search] (only with --stats), "result": "1-0", "0-1" or
+# "1/2-1/2", "plies": number of plies}. Game n goes to shard n % shards (selfplay-00000.jsonl, ...), and games
+# that are already in the output directory are skipped, so an interrupted run is resumed by running it again.
+# The files can be given to book.py to build an opening book.
+#
+# An engine is written as name:option=value,...: "mcts" (options of MCTSAI.mcts such as num_expand, time_ms,
+# max_nodes), "alphabeta" (max_depth, time_ms, max_nodes), "puct" (options of MCTSAI.puct_move such as
+# batch_size), "greedy" or "random", plus the MCTSAI options book, tablebases, see_rollouts, batch_rollouts,
+# reuse_tree, evaluator (the path of MLPEvaluator weights) and search_stats (adds the SearchStats of every MCTS
+# search to the --stats records, see search_stats.py). batch_rollouts is slower than the default rollouts at the
+# default num_rollout of 50, it only pays off with long rollouts, and it cannot be combined with see_rollouts.
+#
+# Usage:
+#   python selfplay.py --games 1000 --red "alphabeta:time_ms=200" --black "mcts:max_nodes=300" --workers 4
+#   python selfplay.py --games 1000 --out selfplay --shards 8 --random-plies 4 --stats
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from mcts import MCTSAI
+from position import encode_move, move_to_iccs, square
+from rules import Board
+
+ENGINES = ("mcts", "alphabeta", "puct", "greedy", "random")
+# options given to the MCTSAI constructor, the others are given to the search
+CONSTRUCTOR_OPTIONS = ("book", "tablebases", "see_rollouts", "batch_rollouts", "reuse_tree", "evaluator",
+                       "search_stats")
+RESULTS = {"red": "1-0", "black": "0-1", None: "1/2-1/2"}
+
+
+def parse_engine(spec):
+    # "mcts:num_expand=200,rollout_depth=20" -> ("mcts", {"num_expand": 200, "rollout_depth": 20})
+    name, _, text = spec.partition(":")
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine {name!r}, expected one of {', '.join(ENGINES)}")
+    options = dict()
+    for item in filter(None, text.split(",")):
+        key, _, value = item.partition("=")
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        if value in ("True", "False"):
+            value = value == "True"
+        options[key] = value
+    return name, options
+
+
+class Player:
+    def __init__(self, color, spec):
+        self.spec = spec
+        self.engine, options = parse_engine(spec)
+        constructor = {key: value for key, value in options.items() if key in CONSTRUCTOR_OPTIONS}
+        self.options = {key: value for key, value in options.items() if key not in CONSTRUCTOR_OPTIONS}
+        engine = self.engine if self.engine in ("mcts", "alphabeta", "puct") else "mcts"
+        self.ai = MCTSAI(color, engine=engine, **constructor)
+
+    def move(self, board):
+        # (piece, move) to play on board, or (None, None) when there is none
+        ai = self.ai
+        ai.update_board(board)
+        ai.last_search = None
+        piece, move = ai.book_move(board)
+        if piece is not None:
+            ai.last_search = {"engine": "book"}
+            return piece, move
+        if self.engine == "mcts":
+            return ai.mcts(board, **self.options)
+        if self.engine == "alphabeta":
+            return ai.alphabeta_move(board, **self.options)
+        if self.engine == "puct":
+            return ai.puct_move(board, **self.options)
+        ai.last_search = {"engine": self.engine}
+        if self.engine == "greedy":
+            return ai.greedy_move()
+        return ai.random_move()
+
+
+def play_game(number, red_spec, black_spec, seed, max_plies=300, random_plies=0, record_stats=False):
+    # plays one game and returns its record
+    random.seed(seed)
+    players = {"red": Player("red", red_spec), "black": Player("black", black_spec)}
+    for player in players.values():
+        player.ai.playout.rng.seed(random.getrandbits(32))
+    board = Board()
+    moves = []
+    stats = []
+    while board.winning is None and len(moves) < max_plies:
+        player = players[board.turn]
+        if len(moves) < random_plies:
+            # random opening plies, so that games with the same engines differ
+            all_moves = player.ai.get_all_moves(board)
+            piece, move = player.ai.to_piece_move(board, random.choice(all_moves)) if all_moves else (None, None)
+            search = {"engine": "random"}
+        else:
+            piece, move = player.move(board)
+            search = player.ai.last_search
+        if piece is None:
+            # the side to move cannot move and loses
+            board.winning = "black" if board.turn == "red" else "red"
+            break
+        moves.append(move_to_iccs(encode_move(square(piece.position), square(move[0]))))
+        if record_stats:
+            stats.append(search)
+        board.make_move(piece, move)
+    game = {"game": number, "red": red_spec, "black": black_spec, "seed": seed, "moves": moves,
+            "result": RESULTS[board.winning], "plies": len(moves)}
+    if record_stats:
+        game["stats"] = stats
+    return game
+
+
+def shard_path(out_dir, shard):
+    return os.path.join(out_dir, f"selfplay-{shard:05d}.jsonl")
+
+
+def finished_games(out_dir, shards):
+    # the numbers of the games already written. A line cut short by an interruption is removed
+    done = set()
+    for shard in range(shards):
+        path = shard_path(out_dir, shard)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb+") as f:
+            good = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    done.add(json.loads(line)["game"])
+                except ValueError:
+                    break
+                good += len(line)
+            f.truncate(good)
+    return done
+
+
+def run(games, red_spec, black_spec, out_dir="selfplay", shards=1, workers=1, seed=0, max_plies=300,
+        random_plies=0, record_stats=False, report_every=10):
+    # Plays games 0 to games - 1 that are not in out_dir yet. Returns the number of games played
+    parse_engine(red_spec)
+    parse_engine(black_spec)
+    os.makedirs(out_dir, exist_ok=True)
+    done = finished_games(out_dir, shards)
+    todo = [number for number in range(games) if number not in done]
+    print(f"Self-play: {len(done)} games already played, {len(todo)} to play")
+    files = [open(shard_path(out_dir, shard), "a") for shard in range(shards)]
+    start = time.perf_counter()
+    results = {result: 0 for result in RESULTS.values()}
+    plies = 0
+    played = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(play_game, number, red_spec, black_spec, seed * 1000003 + number, max_plies,
+                                   random_plies, record_stats)
+                       for number in todo]
+            for future in as_completed(futures):
+                game = future.result()
+                f = files[game["game"] % shards]
+                f.write(json.dumps(game, separators=(",", ":")) + "\n")
+                f.flush()
+                played += 1
+                plies += game["plies"]
+                results[game["result"]] += 1
+                if played % report_every == 0 or played == len(todo):
+                    elapsed = time.perf_counter() - start
+                    print(f"Self-play: {played}/{len(todo)} games, {played * 3600 / elapsed:.0f} games/hour, "
+                          f"{plies * 3600 / elapsed:.0f} positions/hour, results {results}")
+    finally:
+        for f in files:
+            f.close()
+    return played
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless engine against engine games")
+    parser.add_argument("--games", type=int, default=100, help="total number of games in the output directory")
+    parser.add_argument("--red", default="mcts", help="engine of red, e.g. alphabeta:time_ms=200")
+    parser.add_argument("--black", default="mcts", help="engine of black")
+    parser.add_argument("--out", default="selfplay", help="output directory")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-plies", type=int, default=300, help="games longer than this are draws")
+    parser.add_argument("--random-plies", type=int, default=0, help="play this many random plies first")
+    parser.add_argument("--stats", action="store_true", help="record the search summary of every move")
+    args = parser.parse_args(argv)
+    run(args.games, args.red, args.black, args.out, args.shards, args.workers, args.seed, args.max_plies,
+        args.random_plies, args.stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
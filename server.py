@@ -0,0 +1,395 @@
+# Game server: many human against AI games in one process, over JSON lines on local TCP.
+#
+# Every game is a session kept in memory as a Position and its moves, which takes a few kilobytes, so one server
+# holds thousands of them. The searches of the AI run in a shared process pool (one MCTSAI per worker process,
+# reused between requests) and the event loop only waits for their results, so requests that need no search,
+# such as listing the legal moves of a game, are answered at once however many searches are running.
+#
+# Every request is one JSON object on a line, with an "op" and an optional "id" that is copied to the response.
+# Responses are JSON lines {"id": ..., "ok": true, ...} or {"id": ..., "ok": false, "error": "..."}, written
+# when they are ready, so the responses of one connection can come back out of order.
+#   {"op": "new", "ai": "black", "engine": "alphabeta", "time_ms": 500, "fen": "..."}
+#                             new game (ai, engine, time_ms and fen are optional) -> "game", "fen", "turn"
+#   {"op": "moves", "game": g}              legal moves of the side to move in ICCS notation -> "moves"
+#   {"op": "move", "game": g, "move": "h2e2"}
+#                             plays a move; when the AI is to move next it answers, with "reply" its move. If
+#                             the AI cannot answer (e.g. "busy") the request fails and the move is taken back
+#   {"op": "ai_move", "game": g, "time_ms": 500}       the AI plays the side to move -> "move". A search that
+#                                           returns no move fails the request and leaves the game as it was
+#   {"op": "state", "game": g}              -> "fen", "turn", "moves", "result"
+#   {"op": "close", "game": g}
+#   {"op": "metrics"}                       counters of the server, see GameServer.metrics
+# A game's result is "1-0", "0-1" or null while it goes on. The time budget of a search is capped by
+# --max-time-ms.
+#
+# Backpressure: a connection has at most max_inflight requests being handled, past that the server stops
+# reading from it (and the client's writes block); and at most max_pending searches are queued for the pool,
+# past that search requests fail at once with "busy" instead of queueing without bound. Sessions idle for
+# longer than session_ttl seconds are dropped.
+#
+# Usage:
+#   python server.py --port 8765 --workers 4 --max-pending 64
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from fen import START_FEN, board_from_fen, position_from_fen, position_to_fen
+from mcts import MCTSAI
+from position import BLACK, COLORS, RED, SIDE_OF_COLOR, encode_move, iccs_to_move, move_to_iccs, square
+
+ENGINES = ("alphabeta", "mcts", "puct")
+OPS = ("new", "metrics", "moves", "state", "close", "move", "ai_move")
+RESULTS = {RED: "1-0", BLACK: "0-1"}
+
+
+class Session:
+    def __init__(self, number, pos, ai_side, engine, time_ms):
+        self.number = number
+        self.pos = pos
+        # side played by the AI, or None for a game without AI
+        self.ai_side = ai_side
+        self.engine = engine
+        self.time_ms = time_ms
+        self.moves = []
+        # a search of this game is running
+        self.searching = False
+        self.last_used = time.monotonic()
+
+    def legal_moves(self):
+        if self.result() is not None:
+            return []
+        return self.pos.gen_moves()
+
+    def result(self):
+        # the side that won, or None while the game goes on
+        pos = self.pos
+        if pos.winning is not None:
+            return pos.winning
+        if not pos.gen_moves():
+            # the side to move cannot move and loses
+            return pos.turn ^ 1
+        return None
+
+    def play(self, move):
+        self.pos.make_move(move)
+        self.moves.append(move_to_iccs(move))
+
+    def undo(self):
+        self.pos.unmake_move()
+        self.moves.pop()
+
+    def state(self):
+        result = self.result()
+        return {"game": self.number, "fen": position_to_fen(self.pos), "turn": COLORS[self.pos.turn],
+                "moves": self.moves, "result": None if result is None else RESULTS[result]}
+
+
+class RequestError(Exception):
+    pass
+
+
+def is_int(value):
+    # JSON integers, bool is an int subclass
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# the AI of each pool worker process, by engine options
+_ais = dict()
+
+
+def search_move(fen, engine, time_ms, book=None, tablebases=None):
+    # runs in a pool worker: returns the ICCS move of the AI in the position of fen, or None when it has none
+    key = (engine, book, tablebases)
+    ai = _ais.get(key)
+    if ai is None:
+        ai = _ais[key] = MCTSAI(engine=engine, book=book, tablebases=tablebases)
+    board = board_from_fen(fen)
+    ai.color = board.turn
+    ai.update_board(board)
+    piece, move = ai.move(board, time_ms=time_ms)
+    if piece is None:
+        return None
+    return move_to_iccs(encode_move(square(piece.position), square(move[0])))
+
+
+class GameServer:
+    def __init__(self, host="127.0.0.1", port=8765, workers=None, max_pending=64, max_inflight=32,
+                 max_sessions=100000, session_ttl=3600, default_time_ms=500, max_time_ms=10000, book=None,
+                 tablebases=None):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.max_pending = max_pending
+        self.max_inflight = max_inflight
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.default_time_ms = default_time_ms
+        self.max_time_ms = max_time_ms
+        self.book = book
+        self.tablebases = tablebases
+        self.sessions = dict()
+        self.numbers = itertools.count(1)
+        self.pool = None
+        self.server = None
+        self.expire_task = None
+        # metrics
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.pending = 0
+        self.searches = 0
+        self.rejected = 0
+        self.search_time = 0.0
+        self.max_search_time = 0.0
+        self.request_time = 0.0
+        self.max_request_time = 0.0
+        self.started = time.monotonic()
+
+    async def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.expire_task = asyncio.get_running_loop().create_task(self.expire_sessions())
+        print(f"Server: listening on {self.host}:{self.port} with {self.workers} search workers")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def expire_sessions(self):
+        while True:
+            await asyncio.sleep(min(self.session_ttl, 60))
+            now = time.monotonic()
+            for number in [number for number, session in self.sessions.items()
+                           if not session.searching and now - session.last_used > self.session_ttl]:
+                del self.sessions[number]
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        inflight = asyncio.Semaphore(self.max_inflight)
+        tasks = set()
+        try:
+            while True:
+                # stop reading while this connection has max_inflight requests being handled
+                await inflight.acquire()
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    # ValueError: a line longer than the stream limit
+                    break
+                if not line:
+                    break
+                task = asyncio.get_running_loop().create_task(self.respond(line, writer, inflight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def respond(self, line, writer, inflight):
+        start = time.perf_counter()
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise RequestError("a request must be a JSON object")
+                request_id = request.get("id")
+                response = await self.dispatch(request)
+                response["ok"] = True
+            except (RequestError, ValueError) as e:
+                self.errors += 1
+                response = {"ok": False, "error": str(e)}
+            except Exception as e:
+                # a bug or a failed search (a broken pool, a bad book path...): the client still gets an answer
+                traceback.print_exc()
+                self.errors += 1
+                response = {"ok": False, "error": f"internal error: {type(e).__name__}: {e}"}
+            response["id"] = request_id
+            elapsed = time.perf_counter() - start
+            self.requests += 1
+            self.request_time += elapsed
+            self.max_request_time = max(self.max_request_time, elapsed)
+            if writer.is_closing():
+                return
+            writer.write(json.dumps(response, separators=(",", ":")).encode() + b"\n")
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            inflight.release()
+
+    async def dispatch(self, request):
+        op = request.get("op")
+        if not isinstance(op, str) or op not in OPS:
+            raise RequestError(f"unknown op {op!r}")
+        if op == "new":
+            return self.new_game(request)
+        if op == "metrics":
+            return self.metrics()
+        session = self.session(request)
+        if op == "moves":
+            return {"moves": [move_to_iccs(move) for move in session.legal_moves()]}
+        if op == "state":
+            return session.state()
+        if op == "close":
+            del self.sessions[session.number]
+            return {}
+        if op == "move":
+            return await self.play_move(session, request)
+        # ai_move
+        return {"move": await self.ai_move(session, request.get("time_ms"))}
+
+    def session(self, request):
+        number = request.get("game")
+        session = self.sessions.get(number) if is_int(number) else None
+        if session is None:
+            raise RequestError(f"no game {request.get('game')!r}")
+        session.last_used = time.monotonic()
+        return session
+
+    def new_game(self, request):
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError("too many games")
+        ai = request.get("ai", "black")
+        if ai is not None and (not isinstance(ai, str) or ai not in SIDE_OF_COLOR):
+            raise RequestError(f"ai must be red, black or null, not {ai!r}")
+        engine = request.get("engine", "alphabeta")
+        if not isinstance(engine, str) or engine not in ENGINES:
+            raise RequestError(f"unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+        fen = request.get("fen", START_FEN)
+        if not isinstance(fen, str):
+            raise RequestError(f"invalid fen {fen!r}")
+        try:
+            pos = position_from_fen(fen)
+        except (ValueError, IndexError):
+            raise RequestError(f"invalid fen {fen!r}")
+        session = Session(next(self.numbers), pos, None if ai is None else SIDE_OF_COLOR[ai], engine,
+                          self.time_budget(request.get("time_ms")))
+        self.sessions[session.number] = session
+        return {"game": session.number, "fen": position_to_fen(pos), "turn": COLORS[pos.turn]}
+
+    def time_budget(self, time_ms):
+        if time_ms is None:
+            return self.default_time_ms
+        if isinstance(time_ms, bool) or not isinstance(time_ms, (int, float)) or time_ms <= 0:
+            raise RequestError(f"invalid time_ms {time_ms!r}")
+        return min(time_ms, self.max_time_ms)
+
+    async def play_move(self, session, request):
+        if session.searching:
+            raise RequestError("the AI is thinking")
+        if session.result() is not None:
+            raise RequestError("the game is over")
+        text = request.get("move")
+        if not isinstance(text, str):
+            raise RequestError(f"invalid move {text!r}")
+        try:
+            move = iccs_to_move(text)
+        except (ValueError, IndexError):
+            raise RequestError(f"invalid move {text!r}")
+        if move not in session.pos.gen_moves():
+            raise RequestError(f"illegal move {text!r}")
+        session.play(move)
+        response = dict()
+        if session.ai_side == session.pos.turn and session.result() is None:
+            try:
+                response["reply"] = await self.ai_move(session, request.get("time_ms"))
+            except Exception:
+                # the move is taken back when the AI cannot answer it (busy pool, failed search...), so that the
+                # failed request leaves the game as it was
+                session.undo()
+                raise
+        result = session.result()
+        response["result"] = None if result is None else RESULTS[result]
+        return response
+
+    async def ai_move(self, session, time_ms=None):
+        # searches the position of session in the pool and plays the move found
+        if session.searching:
+            raise RequestError("the AI is thinking")
+        if session.result() is not None:
+            raise RequestError("the game is over")
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise RequestError("busy")
+        time_ms = session.time_ms if time_ms is None else self.time_budget(time_ms)
+        session.searching = True
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(
+                self.pool, search_move, position_to_fen(session.pos), session.engine, time_ms, self.book,
+                self.tablebases)
+        finally:
+            session.searching = False
+            self.pending -= 1
+        elapsed = time.perf_counter() - start
+        self.searches += 1
+        self.search_time += elapsed
+        self.max_search_time = max(self.max_search_time, elapsed)
+        # the game is not over, so the side to move has a move: a search without one failed
+        move = None if text is None else iccs_to_move(text)
+        if move not in session.pos.gen_moves():
+            raise RequestError(f"the AI did not find a move ({text!r})")
+        session.play(move)
+        session.last_used = time.monotonic()
+        return text
+
+    def metrics(self):
+        # pending is the queue depth of the pool: the searches submitted and not finished yet, at most
+        # max_pending. Times are in milliseconds
+        return {"sessions": len(self.sessions), "connections": self.connections, "requests": self.requests,
+                "errors": self.errors, "pending": self.pending, "max_pending": self.max_pending,
+                "workers": self.workers, "searches": self.searches, "rejected": self.rejected,
+                "search_ms_avg": 1000 * self.search_time / self.searches if self.searches else 0.0,
+                "search_ms_max": 1000 * self.max_search_time,
+                "request_ms_avg": 1000 * self.request_time / self.requests if self.requests else 0.0,
+                "request_ms_max": 1000 * self.max_request_time,
+                "uptime_s": time.monotonic() - self.started}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JSON lines game server for human against AI games")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="search processes")
+    parser.add_argument("--max-pending", type=int, default=64, help="searches queued before requests are refused")
+    parser.add_argument("--max-inflight", type=int, default=32, help="requests handled at once per connection")
+    parser.add_argument("--max-sessions", type=int, default=100000)
+    parser.add_argument("--session-ttl", type=float, default=3600, help="seconds before an idle game is dropped")
+    parser.add_argument("--time-ms", type=int, default=500, help="default search time")
+    parser.add_argument("--max-time-ms", type=int, default=10000)
+    parser.add_argument("--book", help="opening book, see book.py")
+    parser.add_argument("--tablebases", help="tablebase directory, see tablebase.py")
+    args = parser.parse_args(argv)
+    server = GameServer(args.host, args.port, args.workers, args.max_pending, args.max_inflight, args.max_sessions,
+                        args.session_ttl, args.time_ms, args.max_time_ms, args.book, args.tablebases)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,534 @@
+# Endgame tablebases.
+#
+# A tablebase holds the game theoretic value (win, draw or loss for the side to move) and the distance to mate
+# (the number of plies until the general is captured, or until the losing side has no move, with best play:
+# the winner mates as fast as it can and the loser holds out as long as it can) of every position of one
+# material set, such as "GR-GAA": the red pieces, a dash and the black pieces, by Piece.name.
+#
+# Positions are numbered by a mixed radix index over the squares each piece can stand on (its palace for a
+# general, the advisor and elephant squares, the squares a soldier can reach, the whole board for the others)
+# and the side to move, so a position is found in O(1) without any search. Index numbers where two pieces
+# would share a square are unused.
+#
+# Tables are generated by retrograde analysis. A first pass looks at the moves of every position: positions
+# without a move are lost, captures lead to a smaller material set whose table is generated first (capturing
+# the general wins at once), and the remaining quiet moves are counted. Then, one ply at a time, every
+# position resolved at distance n un-makes the quiet moves that lead to it: a predecessor of a lost position
+# is won at n + 1, and a predecessor all of whose moves lead to won positions is lost at n + 1. Whatever is
+# left unresolved at the end is a draw. Both passes are split in chunks that run in a process pool, and the
+# state is saved to a .part file as the generation goes, so an interrupted generation resumes where it
+# stopped.
+#
+# The file of a table (<material>.xqtb) has a 32 byte header, one value byte per index and then the distance
+# to mate of every index as a 16 bit integer; it is opened with mmap. TablebaseSet opens all the tables of a
+# directory and also answers for the color-flipped material sets (a "GAA-GR" position is looked up in the
+# "GR-GAA" table upside down).
+#
+# Usage:
+#   python tablebase.py generate GR-GAA GH-GA --dir tablebases --workers 4
+#   python tablebase.py probe GR-GAA --dir tablebases --index 12345
+
+import argparse
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from position import (Position, RED, BLACK, COLORS, COLS, ROWS, NUM_SQUARES, EMPTY, BLACK_FLAG, TYPE_MASK,
+                      GENERAL, ADVISOR, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER, PIECE_NAMES, TYPE_OF_NAME,
+                      GENERAL_SQUARES, ADVISOR_SQUARES, ELEPHANT_SQUARES, SOLDIER_SQUARES, HORSE_TABLE,
+                      ELEPHANT_TABLE, ADVISOR_TABLE, GENERAL_TABLE, SOLDIER_TABLE, ORTHOGONAL, on_board, make_code,
+                      side_of, type_of)
+
+# values, from the point of view of the side to move. During generation DRAW also means not resolved yet
+DRAW, WIN, LOSS, INVALID = 0, 1, 2, 3
+
+MAGIC = b"XQTB"
+VERSION = 1
+HEADER = struct.Struct("<4sI16sQ")
+DTM = struct.Struct("<H")
+
+# number of indices per chunk of work
+CHUNK_SIZE = 20000
+# the .part file is saved at most this often during the first pass, and after every ply of the second
+CHECKPOINT_SECONDS = 30
+
+
+def piece_domain(code):
+    # the sorted squares a piece can stand on
+    piece_type, side = type_of(code), side_of(code)
+    if piece_type == GENERAL:
+        return sorted(GENERAL_SQUARES[side])
+    if piece_type == ADVISOR:
+        return sorted(ADVISOR_SQUARES[side])
+    if piece_type == ELEPHANT:
+        return sorted(ELEPHANT_SQUARES[side])
+    if piece_type == SOLDIER:
+        return sorted(SOLDIER_SQUARES[side])
+    return list(range(NUM_SQUARES))
+
+
+def flip_square(sq):
+    # the square seen from the other side of the board
+    row, col = divmod(sq, COLS)
+    return (ROWS - 1 - row) * COLS + col
+
+
+def material_name(pos, flipped=False):
+    # the material set of a Position, e.g. "GR-GAA"; with flipped, the one of the color-flipped position
+    names = []
+    for side in (RED, BLACK):
+        types = sorted(pos.squares[sq] & TYPE_MASK for sq in pos.pieces[side])
+        names.append("".join(PIECE_NAMES[t] for t in types))
+    if flipped:
+        names.reverse()
+    return "-".join(names)
+
+
+class Material:
+    def __init__(self, name):
+        red, black = name.upper().split("-")
+        if red.count("G") != 1 or black.count("G") != 1:
+            raise ValueError(f"{name}: both sides need exactly one general")
+        # the piece codes of the slots of an index, red pieces then black pieces, ordered by piece type
+        self.codes = ([make_code(TYPE_OF_NAME[c], RED) for c in sorted(red, key=TYPE_OF_NAME.get)] +
+                      [make_code(TYPE_OF_NAME[c], BLACK) for c in sorted(black, key=TYPE_OF_NAME.get)])
+        self.name = "-".join("".join(PIECE_NAMES[type_of(code)] for code in self.codes if side_of(code) == side)
+                             for side in (RED, BLACK))
+        self.domains = [piece_domain(code) for code in self.codes]
+        self.domain_index = [{sq: i for i, sq in enumerate(domain)} for domain in self.domains]
+        self.radix = [len(domain) for domain in self.domains]
+        self.size = 2
+        for radix in self.radix:
+            self.size *= radix
+
+    def index(self, turn, slots):
+        # the index of the position with turn to move and the piece of every slot on the given square
+        index = turn
+        for domain_index, radix, sq in zip(self.domain_index, self.radix, slots):
+            index = index * radix + domain_index[sq]
+        return index
+
+    def decode(self, index):
+        # (turn, squares of the slots), the inverse of index
+        slots = [0] * len(self.codes)
+        for i in range(len(self.codes) - 1, -1, -1):
+            index, d = divmod(index, self.radix[i])
+            slots[i] = self.domains[i][d]
+        return index, slots
+
+    def slots(self, pos, flipped=False):
+        # the squares of the slots for a Position with this material (or its color-flipped one)
+        by_code = dict()
+        for side in (RED, BLACK):
+            for sq in pos.pieces[side]:
+                code = pos.squares[sq]
+                if flipped:
+                    code ^= BLACK_FLAG
+                    sq = flip_square(sq)
+                by_code.setdefault(code, []).append(sq)
+        slots = []
+        taken = dict()
+        for code in self.codes:
+            i = taken.get(code, 0)
+            if i == 0:
+                by_code[code].sort()
+            slots.append(by_code[code][i])
+            taken[code] = i + 1
+        return slots
+
+    def load(self, pos, index):
+        # sets pos to the position of index, returns its slots or None if two pieces share a square
+        turn, slots = self.decode(index)
+        if len(set(slots)) != len(slots):
+            return None
+        pos.clear()
+        for code, sq in zip(self.codes, slots):
+            pos.put_square(sq, code)
+        pos.set_turn(turn)
+        return slots
+
+    def without(self, slot):
+        # the material name after the piece of slot is captured
+        codes = self.codes[:slot] + self.codes[slot + 1:]
+        return "-".join("".join(PIECE_NAMES[type_of(code)] for code in codes if side_of(code) == side)
+                        for side in (RED, BLACK))
+
+
+# Tables to un-make quiet moves: for every destination square, the squares a piece could have come from
+_reverse_horse = [[] for _ in range(NUM_SQUARES)]
+for _frm in range(NUM_SQUARES):
+    for _to, _block, _move in HORSE_TABLE[_frm]:
+        _reverse_horse[_to].append((_frm, _block))
+_reverse_elephant = tuple([[] for _ in range(NUM_SQUARES)] for _ in COLORS)
+_reverse_steps = {piece_type: tuple([[] for _ in range(NUM_SQUARES)] for _ in COLORS)
+                  for piece_type in (GENERAL, ADVISOR, SOLDIER)}
+for _side in (RED, BLACK):
+    for _frm in range(NUM_SQUARES):
+        for _to, _block, _move in ELEPHANT_TABLE[_side][_frm]:
+            _reverse_elephant[_side][_to].append((_frm, _block))
+        for _piece_type, _table in ((GENERAL, GENERAL_TABLE), (ADVISOR, ADVISOR_TABLE), (SOLDIER, SOLDIER_TABLE)):
+            for _to, _move in _table[_side][_frm]:
+                _reverse_steps[_piece_type][_side][_to].append(_frm)
+
+
+def unmove_sources(squares, code, sq):
+    # the empty squares from which the piece with code could have moved quietly to sq
+    piece_type, side = code & TYPE_MASK, code >> 3
+    sources = []
+    if piece_type == CHARIOT or piece_type == CANNON:
+        row, col = divmod(sq, COLS)
+        for dr, dc in ORTHOGONAL:
+            r, c = row + dr, col + dc
+            while on_board(r, c) and squares[r * COLS + c] == EMPTY:
+                sources.append(r * COLS + c)
+                r, c = r + dr, c + dc
+    elif piece_type == HORSE or piece_type == ELEPHANT:
+        table = _reverse_horse if piece_type == HORSE else _reverse_elephant[side]
+        for frm, block in table[sq]:
+            if squares[frm] == EMPTY and squares[block] == EMPTY:
+                sources.append(frm)
+    else:
+        for frm in _reverse_steps[piece_type][side][sq]:
+            if squares[frm] == EMPTY:
+                sources.append(frm)
+    return sources
+
+
+class Tablebase:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, name, size = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a tablebase")
+        self.material = Material(name.rstrip(b"\0").decode())
+        if size != self.material.size or len(self.data) != HEADER.size + 3 * size:
+            raise ValueError(f"{path} is truncated")
+        self.size = size
+
+    def close(self):
+        self.data.close()
+
+    def probe_index(self, index):
+        # (value, distance to mate in plies) of an index
+        return (self.data[HEADER.size + index],
+                DTM.unpack_from(self.data, HEADER.size + self.size + 2 * index)[0])
+
+    def probe(self, pos, flipped=False):
+        # (value, distance to mate) of a Position with this material, or of its color-flipped position
+        turn = pos.turn ^ 1 if flipped else pos.turn
+        return self.probe_index(self.material.index(turn, self.material.slots(pos, flipped)))
+
+
+class TablebaseSet:
+    # all the tables of a directory
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = dict()
+        self.max_pieces = 0
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.endswith(".xqtb"):
+                table = Tablebase(os.path.join(directory, file_name))
+                self.tables[table.material.name] = table
+                self.max_pieces = max(self.max_pieces, len(table.material.codes))
+
+    def __len__(self):
+        return len(self.tables)
+
+    def probe(self, pos):
+        # (value, distance to mate) of a Position, or None if no table has its material
+        if len(pos.pieces[RED]) + len(pos.pieces[BLACK]) > self.max_pieces or pos.winning is not None:
+            return None
+        table = self.tables.get(material_name(pos))
+        if table is not None:
+            return table.probe(pos)
+        table = self.tables.get(material_name(pos, flipped=True))
+        if table is not None:
+            return table.probe(pos, flipped=True)
+        return None
+
+
+# Generation. The worker functions run in the process pool; each worker keeps the materials and the tables of
+# the smaller material sets it needs
+_worker_tables = dict()
+
+
+def _worker_table(directory, name):
+    if name not in _worker_tables:
+        _worker_tables[name] = Tablebase(os.path.join(directory, name + ".xqtb"))
+    return _worker_tables[name]
+
+
+def _worker_material(name):
+    key = ("material", name)
+    if key not in _worker_tables:
+        _worker_tables[key] = Material(name)
+    return _worker_tables[key]
+
+
+def analyse_chunk(name, directory, start, stop):
+    # First pass over indices start to stop. Returns (values, distances, counters, escapes, wins, decrements):
+    # the positions resolved at once and their distances, for every position the number of its moves that
+    # still have to turn out won for the opponent before it is lost and whether it has a capture to a drawn
+    # position, the {index: distance} of the wins by capture, and the (distance, index) of the captures to
+    # positions won by the opponent
+    material = _worker_material(name)
+    pos = Position()
+    values = bytearray(stop - start)
+    distances = array("H", bytes(2 * (stop - start)))
+    counters = array("H", bytes(2 * (stop - start)))
+    escapes = bytearray(stop - start)
+    wins = dict()
+    decrements = []
+    for index in range(start, stop):
+        i = index - start
+        slots = material.load(pos, index)
+        if slots is None:
+            values[i] = INVALID
+            continue
+        moves = pos.gen_moves()
+        if not moves:
+            values[i] = LOSS
+            continue
+        squares = pos.squares
+        best_win = None
+        count = 0
+        for move in moves:
+            to = move % NUM_SQUARES
+            captured = squares[to]
+            if captured == EMPTY:
+                count += 1
+                continue
+            if captured & TYPE_MASK == GENERAL:
+                best_win = 1
+                continue
+            child = _worker_table(directory, material.without(slots.index(to)))
+            pos.make_move(move)
+            value, distance = child.probe(pos)
+            pos.unmake_move()
+            if value == LOSS:
+                if best_win is None or distance + 1 < best_win:
+                    best_win = distance + 1
+            elif value == WIN:
+                count += 1
+                decrements.append((distance, index))
+            else:
+                escapes[i] = 1
+        counters[i] = count
+        if best_win is not None:
+            # a won position is never lost, even if all its other moves lose
+            escapes[i] = 1
+            wins[index] = best_win
+    return values, distances, counters, escapes, wins, decrements
+
+
+def predecessors_chunk(name, indices):
+    # for every index, the indices of the positions that reach it with a quiet move
+    material = _worker_material(name)
+    pos = Position()
+    result = []
+    for index in indices:
+        turn, slots = material.decode(index)
+        material.load(pos, index)
+        squares = pos.squares
+        mover = turn ^ 1
+        predecessors = []
+        for slot, code in enumerate(material.codes):
+            if code >> 3 != mover:
+                continue
+            sq = slots[slot]
+            domain_index = material.domain_index[slot]
+            for frm in unmove_sources(squares, code, sq):
+                if frm not in domain_index:
+                    # a soldier cannot come from there
+                    continue
+                slots[slot] = frm
+                predecessors.append(material.index(mover, slots))
+            slots[slot] = sq
+        result.append(predecessors)
+    return result
+
+
+def _checkpoint(path, state):
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def generate(name, directory, workers=1, pool=None):
+    # Generates the table of a material set in directory, after the tables of the material sets its captures
+    # lead to. Tables that already exist are kept. Returns the path of the table
+    material = Material(name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, material.name + ".xqtb")
+    if os.path.exists(path):
+        return path
+    own_pool = pool is None and workers > 1
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for slot, code in enumerate(material.codes):
+            if code & TYPE_MASK != GENERAL:
+                generate(material.without(slot), directory, workers, pool)
+        _generate_table(material, directory, path, pool)
+    finally:
+        if own_pool:
+            pool.shutdown()
+    return path
+
+
+def _map(pool, function, jobs):
+    # runs function(*job) for every job, in the pool if there is one, and yields the results in order
+    if pool is None:
+        for job in jobs:
+            yield function(*job)
+    else:
+        for future in [pool.submit(function, *job) for job in jobs]:
+            yield future.result()
+
+
+def _generate_table(material, directory, path, pool):
+    start_time = time.perf_counter()
+    size = material.size
+    part_path = path + ".part"
+    if os.path.exists(part_path):
+        with open(part_path, "rb") as f:
+            state = pickle.load(f)
+        print(f"Tablebase {material.name}: resuming")
+    else:
+        state = {"done_chunks": set(), "values": bytearray(size), "distances": array("H", bytes(2 * size)),
+                 "counters": array("H", bytes(2 * size)), "escapes": bytearray(size), "wins": dict(),
+                 "decrements": dict(), "ply": None, "frontier": None, "chunk_size": CHUNK_SIZE}
+    values = state["values"]
+    distances = state["distances"]
+    counters = state["counters"]
+    escapes = state["escapes"]
+    wins = state["wins"]
+    decrements = state["decrements"]
+
+    # first pass
+    chunk_size = state["chunk_size"]
+    chunks = [(start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+    jobs = [(material.name, directory, start, stop) for start, stop in chunks if start not in state["done_chunks"]]
+    last_checkpoint = time.perf_counter()
+    for (name, _, start, stop), result in zip(jobs, _map(pool, analyse_chunk, jobs)):
+        chunk_values, chunk_distances, chunk_counters, chunk_escapes, chunk_wins, chunk_decrements = result
+        values[start:stop] = chunk_values
+        distances[start:stop] = chunk_distances
+        counters[start:stop] = chunk_counters
+        escapes[start:stop] = chunk_escapes
+        wins.update(chunk_wins)
+        for distance, index in chunk_decrements:
+            decrements.setdefault(distance, []).append(index)
+        state["done_chunks"].add(start)
+        if time.perf_counter() - last_checkpoint > CHECKPOINT_SECONDS:
+            _checkpoint(part_path, state)
+            last_checkpoint = time.perf_counter()
+
+    # second pass, one ply at a time. wins by capture are kept by distance
+    if state["ply"] is None:
+        state["ply"] = 0
+        state["frontier"] = [index for index in range(size) if values[index] == LOSS]
+        pending = dict()
+        for index, distance in wins.items():
+            pending.setdefault(distance, []).append(index)
+        state["wins"] = pending
+        _checkpoint(part_path, state)
+    pending = state["wins"]
+    ply = state["ply"]
+    frontier = state["frontier"]
+    while frontier or pending or decrements:
+        resolved = []
+        # positions won at ply + 1 and positions whose moves all lose
+        blocks = [frontier[i:i + CHUNK_SIZE] for i in range(0, len(frontier), CHUNK_SIZE)]
+        jobs = [(material.name, block) for block in blocks]
+        for block, result in zip(blocks, _map(pool, predecessors_chunk, jobs)):
+            for index, predecessors in zip(block, result):
+                if values[index] == LOSS:
+                    for predecessor in predecessors:
+                        if values[predecessor] == DRAW:
+                            values[predecessor] = WIN
+                            distances[predecessor] = ply + 1
+                            resolved.append(predecessor)
+                else:
+                    for predecessor in predecessors:
+                        if _decrement(values, counters, escapes, predecessor):
+                            distances[predecessor] = ply + 1
+                            resolved.append(predecessor)
+        for index in decrements.pop(ply, []):
+            if _decrement(values, counters, escapes, index):
+                distances[index] = ply + 1
+                resolved.append(index)
+        for index in pending.pop(ply + 1, []):
+            if values[index] == DRAW:
+                values[index] = WIN
+                distances[index] = ply + 1
+                resolved.append(index)
+        ply += 1
+        frontier = resolved
+        state["ply"] = ply
+        state["frontier"] = frontier
+        _checkpoint(part_path, state)
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, material.name.encode(), size))
+        f.write(values)
+        if sys.byteorder != "little":
+            distances.byteswap()
+        f.write(distances.tobytes())
+    os.replace(path + ".tmp", path)
+    os.remove(part_path)
+    counts = [values.count(value) for value in (WIN, DRAW, LOSS)]
+    print(f"Tablebase {material.name}: {size} indices, {counts[0]} wins, {counts[1]} draws, {counts[2]} losses, "
+          f"longest mate {max(distances)} plies, {time.perf_counter() - start_time:.1f}s")
+
+
+def _decrement(values, counters, escapes, index):
+    # one more move of an unresolved position leads to a won position. True when the position is now lost
+    if values[index] != DRAW:
+        return False
+    counters[index] -= 1
+    if counters[index] == 0 and not escapes[index]:
+        values[index] = LOSS
+        return True
+    return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="generate the tables of material sets")
+    generate_parser.add_argument("materials", nargs="+", help="material sets such as GR-GAA")
+    generate_parser.add_argument("--dir", default="tablebases")
+    generate_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    probe_parser = commands.add_parser("probe", help="print the value of positions of a table")
+    probe_parser.add_argument("material")
+    probe_parser.add_argument("--dir", default="tablebases")
+    probe_parser.add_argument("--index", type=int, nargs="*", default=[0])
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        for name in args.materials:
+            generate(name, args.dir, args.workers)
+        return 0
+    table = Tablebase(os.path.join(args.dir, Material(args.material).name + ".xqtb"))
+    pos = Position()
+    for index in args.index:
+        value, distance = table.probe_index(index)
+        if value == INVALID:
+            print(f"{index}: invalid")
+            continue
+        table.material.load(pos, index)
+        print(pos)
+        print(f"{index}: {('draw', 'win', 'loss')[value]} for {COLORS[pos.turn]} in {distance} plies")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
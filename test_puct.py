@@ -0,0 +1,32 @@
+# Regression tests for the PUCT search, run with python -m pytest test_puct.py
+
+from fen import board_from_fen, position_from_fen
+from mcts import MCTSAI
+from puct import MaterialEvaluator, PUCTNode, PUCTSearch
+
+# red's only move is the soldier a9b9
+ONE_MOVE_FEN = "P3k4/9/9/9/9/9/9/4p4/3pNp3/3AKA3 w - - 0 1"
+
+
+def test_single_move_is_returned():
+    pos = position_from_fen(ONE_MOVE_FEN)
+    assert len(pos.gen_moves()) == 1
+    search = PUCTSearch(MaterialEvaluator())
+    root = search.run(PUCTNode(), pos, max_nodes=800)
+    assert search.best_move(root) == pos.gen_moves()[0]
+    assert search.root_stats(root)
+
+
+def test_puct_move_plays_single_move():
+    board = board_from_fen(ONE_MOVE_FEN)
+    piece, move = MCTSAI("red", engine="puct").move(board, max_nodes=100)
+    assert piece is not None
+    assert (piece.position, move[0]) == ((1, 1), (1, 2))
+
+
+def test_budget_smaller_than_a_visit():
+    # one evaluation only expands the root, the move with the highest prior is played
+    pos = position_from_fen("rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w - - 0 1")
+    search = PUCTSearch(MaterialEvaluator(), batch_size=1)
+    root = search.run(PUCTNode(), pos, max_nodes=1)
+    assert search.best_move(root) in pos.gen_moves()
@@ -0,0 +1,272 @@
+# Headless engine speaking the UCCI protocol (and the UCI dialect of it) over stdin/stdout, so that the AI can
+# be driven by xiangqi GUIs and match managers.
+#
+# Commands:
+#   ucci / uci                        identify, list the options, answer ucciok / uciok
+#   isready                           readyok
+#   setoption name <name> value <v>   (UCCI also "setoption <name> <v>") options: engine (alphabeta, mcts or
+#                                     puct), book (path of an opening book), tablebases (directory), evaluator
+#                                     (path of MLPEvaluator weights). Files are opened at once, one that cannot
+#                                     be opened is reported on stderr and the option keeps its value
+#   position fen <fen> [moves ...]    set the position, moves in ICCS notation (h2e2)
+#   position startpos [moves ...]
+#   go [depth d] [nodes n] [movetime ms] [time ms increment ms] [wtime ms btime ms winc ms binc ms] [infinite]
+#                                     depth only applies to the alphabeta engine, the others report it on stderr
+#                                     and ignore it. An infinite search answers only after stop
+#   stop                              end the search, which answers bestmove at once
+#   quit
+#
+# The search runs in a background thread while the main thread keeps reading commands, so stop (and quit) take
+# effect as soon as the search checks its stop flag (see MCTSAI.stop): at every node for alpha-beta (once depth 1
+# has given a move), every iteration or batch for MCTS and PUCT. Without depth, nodes, movetime or infinite, the search gets a thirtieth
+# of the remaining clock time plus the increment.
+#
+# Usage:
+#   python ucci.py
+
+import sys
+import threading
+import time
+import traceback
+
+from book import OpeningBook
+from fen import START_FEN, position_from_fen
+from mcts import MCTSAI
+from tablebase import TablebaseSet
+from position import BLACK, COLORS, iccs_to_move, move_to_iccs, encode_move, square
+from alphabeta import MAX_PLY
+
+NAME = "ChineseChessAI"
+ENGINES = ("alphabeta", "mcts", "puct")
+# a search without any limit, stopped by stop or quit
+INFINITE_MS = 10 ** 9
+# fraction of the remaining clock time used for a move
+MOVES_TO_GO = 30
+
+
+def load_evaluator(path):
+    # numpy is only needed for the PUCT search
+    from puct import MLPEvaluator
+    return MLPEvaluator(path)
+
+
+# options opened when they are set, so that a bad path is reported at once and the previous value kept
+OPTION_LOADERS = {"book": OpeningBook, "tablebases": TablebaseSet, "evaluator": load_evaluator}
+
+
+class UCCIEngine:
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.lock = threading.Lock()
+        self.options = {"engine": "alphabeta", "book": None, "tablebases": None, "evaluator": None}
+        self.ai = None
+        self.pos = position_from_fen(START_FEN)
+        self.thread = None
+        # set by stop: an infinite search holds its bestmove until then
+        self.stop_event = threading.Event()
+        self.protocol = "ucci"
+
+    def send(self, line):
+        with self.lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def get_ai(self):
+        # the AI is created on first use, after the options are set
+        if self.ai is None:
+            self.ai = MCTSAI(COLORS[self.pos.turn], engine=self.options["engine"], book=self.options["book"],
+                             tablebases=self.options["tablebases"], evaluator=self.options["evaluator"])
+        return self.ai
+
+    def handle(self, line):
+        # handles one command line, returns False on quit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command in ("ucci", "uci"):
+            self.protocol = command
+            self.send(f"id name {NAME}")
+            if command == "ucci":
+                self.send(f"option engine type combo default alphabeta {' '.join('var ' + e for e in ENGINES)}")
+                self.send("option book type string default <empty>")
+                self.send("option tablebases type string default <empty>")
+                self.send("option evaluator type string default <empty>")
+            else:
+                self.send(f"option name engine type combo default alphabeta "
+                          f"{' '.join('var ' + e for e in ENGINES)}")
+                self.send("option name book type string default <empty>")
+                self.send("option name tablebases type string default <empty>")
+                self.send("option name evaluator type string default <empty>")
+            self.send(command + "ok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "position":
+            self.wait()
+            self.set_position(args)
+        elif command == "go":
+            self.wait()
+            self.go(args)
+        elif command == "stop":
+            self.wait()
+        elif command == "quit":
+            self.wait()
+            return False
+        else:
+            print(f"Unknown command: {line.strip()}", file=sys.stderr)
+        return True
+
+    def set_option(self, args):
+        if args and args[0] == "name":
+            name, _, value = " ".join(args[1:]).partition(" value ")
+        else:
+            name, value = args[0] if args else "", " ".join(args[1:])
+        name = name.strip().lower()
+        value = value.strip()
+        if name not in self.options:
+            print(f"Unknown option: {name}", file=sys.stderr)
+            return
+        if name == "engine" and value not in ENGINES:
+            print(f"Unknown engine {value!r}, expected one of {', '.join(ENGINES)}", file=sys.stderr)
+            return
+        if value in ("", "<empty>"):
+            value = None
+        elif name in OPTION_LOADERS:
+            try:
+                value = OPTION_LOADERS[name](value)
+            except Exception as e:
+                print(f"Cannot load {name} {value!r}, keeping the previous value: {e}", file=sys.stderr)
+                return
+        self.wait()
+        self.options[name] = value
+        self.ai = None
+
+    def set_position(self, args):
+        if "moves" in args:
+            i = args.index("moves")
+            args, moves = args[:i], args[i + 1:]
+        else:
+            moves = []
+        if args and args[0] == "startpos":
+            fen = START_FEN
+        elif args and args[0] == "fen":
+            fen = " ".join(args[1:])
+        else:
+            print(f"Invalid position command: {' '.join(args)}", file=sys.stderr)
+            return
+        try:
+            pos = position_from_fen(fen)
+            for text in moves:
+                move = iccs_to_move(text)
+                if move not in pos.gen_moves():
+                    raise ValueError(f"Illegal move {text}")
+                pos.make_move(move)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return
+        self.pos = pos
+
+    def go(self, args):
+        limits = dict()
+        i = 0
+        while i < len(args):
+            if args[i] in ("infinite", "ponder"):
+                limits[args[i]] = True
+                i += 1
+                continue
+            if i + 1 < len(args):
+                try:
+                    limits[args[i]] = int(args[i + 1])
+                except ValueError:
+                    pass
+            i += 2
+
+        depth = limits.get("depth")
+        max_nodes = limits.get("nodes")
+        time_ms = limits.get("movetime")
+        if time_ms is None and not limits.get("infinite"):
+            # clock time: UCCI gives the time of the side to move, UCI the time of both sides
+            black = self.pos.turn == BLACK
+            clock = limits.get("time", limits.get("btime" if black else "wtime"))
+            increment = limits.get("increment", limits.get("binc" if black else "winc", 0))
+            if clock is not None:
+                time_ms = max(clock // MOVES_TO_GO + increment, 1)
+        if depth is not None and self.options["engine"] != "alphabeta":
+            print(f"go depth is only used by the alphabeta engine, the {self.options['engine']} engine ignores it",
+                  file=sys.stderr)
+            depth = None
+        infinite = limits.get("infinite", False) or limits.get("ponder", False)
+        if depth is None and max_nodes is None and time_ms is None:
+            time_ms = INFINITE_MS
+        board = self.pos.to_board()
+        ai = self.get_ai()
+        ai.color = board.turn
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.think, args=(ai, board, depth, time_ms, max_nodes, infinite),
+                                       daemon=True)
+        self.thread.start()
+
+    def think(self, ai, board, depth, time_ms, max_nodes, infinite=False):
+        # Runs in the search thread and answers bestmove, or nobestmove if the search fails. The protocol wants an
+        # infinite (or ponder) search to answer only after stop, even when it is over sooner (a single move, a
+        # mate found), so its answer waits for stop
+        try:
+            line = self.search(ai, board, depth, time_ms, max_nodes)
+        except Exception:
+            traceback.print_exc()
+            line = "nobestmove" if self.protocol == "ucci" else "bestmove 0000"
+        if infinite:
+            self.stop_event.wait()
+        self.send(line)
+
+    def search(self, ai, board, depth, time_ms, max_nodes):
+        # searches board, sends the info line and returns the bestmove line
+        start = time.perf_counter()
+        ai.last_search = None
+        ai.update_board(board)
+        piece, move = ai.book_move(board)
+        if piece is None:
+            if ai.engine == "alphabeta":
+                piece, move = ai.alphabeta_move(board, depth or MAX_PLY, time_ms, max_nodes)
+            elif ai.engine == "puct":
+                piece, move = ai.puct_move(board, time_ms=time_ms, max_nodes=max_nodes)
+            else:
+                piece, move = ai.mcts(board, time_ms=time_ms, max_nodes=max_nodes)
+        elapsed = int((time.perf_counter() - start) * 1000)
+        search = ai.last_search or dict()
+        if search.get("engine") == "alphabeta":
+            self.send(f"info depth {search['depth']} score {search['score']} nodes {search['nodes']} "
+                      f"time {elapsed}")
+        elif "visits" in search:
+            self.send(f"info nodes {search['visits']} time {elapsed}")
+        if piece is None:
+            return "nobestmove" if self.protocol == "ucci" else "bestmove 0000"
+        return f"bestmove {move_to_iccs(encode_move(square(piece.position), square(move[0])))}"
+
+    def wait(self):
+        # stops the running search, if any, and waits for its bestmove. The search clears the stop flag when it
+        # starts, so stop until it is over
+        thread = self.thread
+        self.stop_event.set()
+        while thread is not None and thread.is_alive():
+            self.ai.stop()
+            thread.join(0.001)
+        self.thread = None
+
+
+def main(argv=None):
+    # the search thread holds the GIL, a shorter switch interval lets the main thread read stop sooner
+    sys.setswitchinterval(0.001)
+    engine = UCCIEngine(sys.stdout)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else:
+        engine.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())